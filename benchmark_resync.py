@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import cv2
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Export modes run by the benchmark: name -> extra sync_mjpeg_batch.py arguments
+MODES = {
+    "mp4": [],
+    "mp4_ffmpeg_x264": ["--encoder", "ffmpeg", "--codec", "libx264", "--preset", "veryfast"],
+    "mp4_ffmpeg_mjpeg_copy": ["--encoder", "ffmpeg", "--codec", "mjpeg"],
+    "pngseq": ["--export_png"],
+    "jpegseq": ["--export_jpeg"],
+    "jpegseq_passthrough": ["--export_jpeg", "--passthrough"],
+}
+
+
+def make_frame_pool(width, height, count, quality):
+    # A handful of distinct JPEG frames, cycled through when writing the take.
+    # Noise keeps the JPEGs close to real sensor data in size and decode cost.
+    rng = np.random.default_rng(0)
+    pool = []
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    for i in range(count):
+        image = np.broadcast_to(gradient, (height, width, 3)).astype(np.float32)
+        image = image + rng.normal(0, 12, (height, width, 3)).astype(np.float32)
+        image = np.clip(image, 0, 255).astype(np.uint8)
+        cv2.putText(image, f"frame {i}", (width // 20, height // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                    height / 200, (255, 255, 255), max(1, height // 150))
+        ok, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        if not ok:
+            raise RuntimeError("Failed to encode synthetic frame")
+        pool.append(buffer.tobytes())
+    return pool
+
+
+def make_camera_pts(rng, frames, fps, jitter_ms, drop_rate, start_offset_ms):
+    # Timestamps in milliseconds like rpicam-vid --save-pts: a nominal fps
+    # grid shifted by a start offset, with per-frame jitter and dropped frames.
+    interval = 1000.0 / fps
+    ticks = np.arange(frames * 2)
+    if drop_rate > 0:
+        ticks = ticks[rng.random(len(ticks)) >= drop_rate]
+    ticks = ticks[:frames]
+    pts = start_offset_ms + ticks * interval + rng.normal(0, jitter_ms, len(ticks))
+    return np.maximum.accumulate(pts)
+
+
+def generate_take(take_dir, args):
+    rng = np.random.default_rng(args.seed)
+    print(f"[→] Generating {args.cameras} synthetic cameras, {args.frames} frames at {args.width}x{args.height}")
+    pool = make_frame_pool(args.width, args.height, args.pool_size, args.quality)
+    for cam in range(args.cameras):
+        name = f"cam{cam+1:02d}"
+        start_offset = rng.uniform(0, args.max_start_offset_ms)
+        pts = make_camera_pts(rng, args.frames, args.fps, args.jitter_ms, args.drop_rate, start_offset)
+        with open(os.path.join(take_dir, name + ".mjpeg"), 'wb') as f:
+            for i in range(len(pts)):
+                f.write(pool[i % len(pool)])
+        with open(os.path.join(take_dir, name + ".pts"), 'w') as f:
+            f.write("# timecode format v2\n")
+            f.write("\n".join(f"{t:.3f}" for t in pts))
+            f.write("\n")
+
+
+def clear_sidecars(take_dir):
+    for fname in os.listdir(take_dir):
+        if fname.endswith(".idx") or fname.endswith(".npz"):
+            os.remove(os.path.join(take_dir, fname))
+
+
+def directory_size(path):
+    # Hardlinked duplicate frames share their data, so count each inode once
+    total = 0
+    seen = set()
+    for root, _, files in os.walk(path):
+        for fname in files:
+            stat = os.lstat(os.path.join(root, fname))
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+
+def run_mode(mode, take_dir, output_dir, args):
+    command = [sys.executable, os.path.join(SCRIPT_DIR, "sync_mjpeg_batch.py"),
+               "--input_dir", take_dir, "--output_dir", output_dir,
+               "--auto_master", "timeline", "--fps", str(args.fps),
+               "--workers", str(args.workers), "--force", *MODES[mode]]
+    if args.cold:
+        clear_sidecars(take_dir)
+    started = time.time()
+    with open(os.path.join(output_dir + ".log"), 'w') as log:
+        process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+        # os.wait4 reports the resource usage of this run alone (including the
+        # worker processes it waited for), unlike RUSAGE_CHILDREN.
+        _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.time() - started
+    returncode = os.waitstatus_to_exitcode(status)
+    process.returncode = returncode
+
+    frames = 0
+    failed_cameras = []
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        frames = sum(entry.get("last_completed_frame", 0) for entry in manifest["cameras"].values())
+        failed_cameras = sorted(name for name, entry in manifest["cameras"].items() if entry.get("status") != "done")
+    return {
+        "mode": mode,
+        "returncode": returncode,
+        "ok": returncode == 0 and not failed_cameras and frames > 0,
+        "failed_cameras": failed_cameras,
+        "seconds": seconds,
+        "output_frames": frames,
+        "frames_per_second": frames / seconds if seconds > 0 else 0.0,
+        "peak_rss_mb": usage.ru_maxrss / 1024.0,
+        "bytes_written": directory_size(output_dir),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync_mjpeg_batch.py export modes on a synthetic take")
+    parser.add_argument('--output', default="bench_results.json", help="Path of the JSON results file")
+    parser.add_argument('--work_dir', default=None, help="Directory for the synthetic take and outputs (default: a temp dir, removed afterwards)")
+    parser.add_argument('--cameras', type=int, default=2, help="Number of synthetic cameras")
+    parser.add_argument('--frames', type=int, default=120, help="Frames per camera")
+    parser.add_argument('--width', type=int, default=4056, help="Frame width")
+    parser.add_argument('--height', type=int, default=3040, help="Frame height")
+    parser.add_argument('--fps', type=int, default=24, help="Camera and output framerate")
+    parser.add_argument('--quality', type=int, default=90, help="JPEG quality of the synthetic frames")
+    parser.add_argument('--pool_size', type=int, default=8, help="Number of distinct frames cycled through")
+    parser.add_argument('--jitter_ms', type=float, default=1.0, help="Standard deviation of per-frame timestamp jitter (ms)")
+    parser.add_argument('--drop_rate', type=float, default=0.02, help="Probability that a camera drops a frame")
+    parser.add_argument('--max_start_offset_ms', type=float, default=200.0, help="Maximum random start offset per camera (ms)")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed for the synthetic take")
+    parser.add_argument('--workers', type=int, default=1, help="--workers passed to sync_mjpeg_batch.py")
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=sorted(MODES), help="Export modes to run")
+    parser.add_argument('--cold', action='store_true', help="Delete cached frame indices and PTS before every run")
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="resync_bench_")
+    take_dir = os.path.join(work_dir, "take")
+    os.makedirs(take_dir, exist_ok=True)
+    try:
+        generate_take(take_dir, args)
+        results = []
+        for mode in args.modes:
+            output_dir = os.path.join(work_dir, mode)
+            if os.path.exists(output_dir):
+                shutil.rmtree(output_dir)
+            os.makedirs(output_dir)
+            print(f"[→] Running {mode} ...")
+            result = run_mode(mode, take_dir, output_dir, args)
+            status = "✓" if result["ok"] else "!"
+            print(f"[{status}] {mode}: {result['frames_per_second']:.1f} frames/s, "
+                  f"peak RSS {result['peak_rss_mb']:.0f} MB, {result['bytes_written'] / 1024 ** 2:.1f} MB written")
+            if not result["ok"]:
+                print(f"[!] {mode} failed (exit code {result['returncode']}, failed cameras: "
+                      f"{', '.join(result['failed_cameras']) or 'none'}), see {output_dir}.log"
+                      f"{'' if args.work_dir else ' (pass --work_dir to keep it)'}")
+            results.append(result)
+
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "work_dir")},
+            "results": results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[✓] Benchmark results saved to {args.output}")
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -198,7 +198,7 @@ def record():
                     error_msg = response.json().get('error', 'Unknown error')
                     print(f"Error transferring video from {ip}: {error_msg}")
                     return f"Error transferring video from {ip}: {error_msg}"
-                print(f"File transfer from {ip} completed successfully.")
+                print(f"File transfer from {ip} queued on the node.")
             except requests.RequestException as e:
                 print(f"Error transferring video from {ip}: {e}")
                 return f"Error transferring video from {ip}: {e}"
@@ -321,6 +321,20 @@ def update_servers():
 
     return jsonify({'success': success, 'message': messages, 'errors': errors})
 
+@app.route('/transfer_status', methods=['GET'])
+def transfer_status():
+    """Collect every node's transfer spool status, so queued and failed uploads are visible on the dashboard."""
+    def node_status(ip):
+        try:
+            response = requests.get(f'http://{ip}:5000/transfer_status', timeout=5)
+            response.raise_for_status()
+            return ip, response.json()
+        except requests.RequestException as e:
+            return ip, {"error": str(e)}
+
+    with ThreadPoolExecutor() as executor:
+        return jsonify(dict(executor.map(node_status, raspberry_pi_ips)))
+
 @app.route('/take_photo', methods=['POST'])
 def take_photo():
     """Trigger photo capture on all Raspberry Pis with two-phase process."""
@@ -343,7 +357,9 @@ def take_photo():
             data = response.json()
 
             if data.get('success', False):
-                print(f"Photo captured successfully on {ip}.")
+                latency_ms = data.get('latency_ms')
+                latency = f" (trigger-to-exposure {latency_ms:.1f} ms)" if latency_ms is not None else ""
+                print(f"Photo captured successfully on {ip}{latency}.")
                 return None  # No error
             else:
                 error_message = f"Error capturing photo on {ip}: {data.get('error', 'Unknown error')}"
@@ -381,7 +397,7 @@ def take_photo():
             data = response.json()
 
             if data.get('success', False):
-                print(f"Photo transferred successfully from {ip}.")
+                print(f"Photo transfer queued on {ip}.")
                 return None  # No error
             else:
                 error_message = f"Error transferring photo from {ip}: {data.get('error', 'Unknown error')}"
@@ -406,12 +422,12 @@ def take_photo():
         success = False
         print(f"Phase 2 completed with {len(transfer_results)} errors out of {len(raspberry_pi_ips)} devices.")
     else:
-        print(f"Phase 2 completed successfully: All {len(raspberry_pi_ips)} photos transferred and deleted.")
+        print(f"Phase 2 completed successfully: All {len(raspberry_pi_ips)} photos queued for transfer; check /transfer_status for uploads.")
 
     print("=== PHOTO CAPTURE PROCESS COMPLETED ===")
     
     if success:
-        messages.append(f"Successfully captured and transferred photos from all {len(raspberry_pi_ips)} devices.")
+        messages.append(f"Successfully captured photos on all {len(raspberry_pi_ips)} devices and queued them for transfer.")
     
     return jsonify({'success': success, 'message': messages, 'errors': errors})
 
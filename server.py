@@ -1,23 +1,42 @@
+import time
+BOOT_STARTED = time.time()  # Taken before any other import, for the time to first /hostname response
+
 import subprocess
 import sys
 import os
-import time
 import datetime
 import socket
-import pkg_resources
 import platform
 import signal
-
-def is_bookworm():
-    """Check if the OS is Raspbian Bookworm."""
+import io
+import json
+import mmap
+import queue
+import threading
+import functools
+from collections import deque
+import hashlib
+import importlib.metadata
+
+ENV_STAMP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".verified_env.json")
+boot_timings = {}  # Seconds spent in each boot phase, reported by /boot_status
+
+@functools.lru_cache(maxsize=None)
+def read_os_release():
+    """Read /etc/os-release once per process."""
     try:
         with open("/etc/os-release", "r") as f:
-            os_release = f.read().lower()
-            print(f"Contents of /etc/os-release: {os_release}")  # Debugging output
-            return "bookworm" in os_release
+            return f.read()
     except Exception as e:
         print(f"Error reading /etc/os-release: {e}")
-        return False
+        return ""
+
+@functools.lru_cache(maxsize=None)
+def is_bookworm():
+    """Check if the OS is Raspbian Bookworm."""
+    os_release = read_os_release().lower()
+    print(f"Contents of /etc/os-release: {os_release}")  # Debugging output
+    return "bookworm" in os_release
 
 def install(package):
     if package == "python3-picamera2":
@@ -52,9 +71,9 @@ def install(package):
 def is_python_package_installed(package):
     """Check if a Python package is installed."""
     try:
-        pkg_resources.get_distribution(package)
+        importlib.metadata.distribution(package)
         return True
-    except pkg_resources.DistributionNotFound:
+    except importlib.metadata.PackageNotFoundError:
         return False
 
 def is_system_package_installed(package):
@@ -77,23 +96,83 @@ required_packages = [
     "libcamera-apps"
 ]
 
-# Install missing packages
-for package in required_packages:
+# Python distributions and apt packages whose installed versions make up the
+# environment stamp. python3-picamera2 is the apt package of the picamera2
+# distribution; the system_packages step and libcamera-apps are apt-only.
+FINGERPRINT_DISTRIBUTIONS = ["flask", "adafruit-circuitpython-servokit", "adafruit-circuitpython-pca9685",
+                             "opencv-python", "picamera2"]
+FINGERPRINT_APT_PACKAGES = ["python3-picamera2", "libcamera-apps", "ffmpeg",
+                            "libatlas-base-dev", "libhdf5-dev", "libhdf5-serial-dev"]
+
+def installed_apt_versions(packages):
+    """Installed dpkg version of each package (None if not installed), from a single dpkg-query call."""
+    versions = dict.fromkeys(packages)
+    try:
+        result = subprocess.run(["dpkg-query", "-W", "-f", "${Package} ${Status} ${Version}\n", *packages],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return versions
+    for line in result.stdout.decode("utf-8", errors="replace").splitlines():
+        fields = line.split()
+        # "<package> install ok installed <version>"; removed packages keep a
+        # dpkg entry with another status and are reported as missing.
+        if len(fields) == 5 and fields[1:4] == ["install", "ok", "installed"] and fields[0] in versions:
+            versions[fields[0]] = fields[4]
+    return versions
+
+def environment_fingerprint():
+    """OS release, Python version and installed versions of the required Python and apt packages."""
+    versions = {}
+    for package in FINGERPRINT_DISTRIBUTIONS:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        "os_release": read_os_release(),
+        "python": sys.version,
+        "packages": versions,
+        "apt_packages": installed_apt_versions(FINGERPRINT_APT_PACKAGES),
+    }
+
+def environment_verified(fingerprint):
+    """True if the stamp written after the last full dependency check matches this environment."""
+    if os.environ.get("FORCE_ENV_CHECK"):
+        return False
     try:
-        __import__(package)
-    except ImportError:
-        install(package)
+        with open(ENV_STAMP_PATH) as f:
+            return json.load(f) == fingerprint
+    except (OSError, ValueError):
+        return False
 
-from flask import Flask, render_template, request, jsonify, Response
-from adafruit_servokit import ServoKit
-import cv2
+def verify_environment():
+    """Install missing packages, skipping the apt/dpkg/pip probing when the environment stamp matches."""
+    fingerprint = environment_fingerprint()
+    if environment_verified(fingerprint):
+        print("Environment matches the verified stamp, skipping dependency checks.")
+        return
+    # Install missing packages
+    for package in required_packages:
+        try:
+            __import__(package)
+        except ImportError:
+            install(package)
+    with open(ENV_STAMP_PATH, "w") as f:
+        json.dump(environment_fingerprint(), f, indent=2)
+    print(f"Dependencies verified, stamp written to {ENV_STAMP_PATH}")
+
+phase_started = time.time()
+verify_environment()
+boot_timings["environment_check"] = time.time() - phase_started
+
+# cv2 (software preview fallback) and the adafruit servo libraries are imported where they are used
+phase_started = time.time()
+from flask import Flask, render_template, request, jsonify, Response, send_from_directory
 from picamera2 import Picamera2, libcamera
-from picamera2.encoders import H264Encoder
-from picamera2.outputs import FfmpegOutput
+from picamera2.encoders import H264Encoder, MJPEGEncoder
+from picamera2.outputs import FfmpegOutput, FileOutput
 from libcamera import controls
-import board
-import busio
-from adafruit_pca9685 import PCA9685
+boot_timings["imports"] = time.time() - phase_started
 
 app = Flask(__name__)
 
@@ -103,55 +182,158 @@ recording_process = None  # To keep track of the recording process
 camera_model = ""  # Variable to store the camera model name
 is_recording = False  # Tracks recording state for picamera2
 
-# Check if servos are connected
-try:
-    i2c = busio.I2C(board.SCL, board.SDA)
-    pca = PCA9685(i2c)
-    pca.frequency = 50
-    pca.deinit()
-    servos_found = True
-except Exception as e:
-    print("Servos not found.")
+class FrameBroadcaster(io.BufferedIOBase):
+    """Hold the latest preview JPEG and wake every waiting viewer when a new one is published."""
+
+    def __init__(self):
+        super().__init__()
+        self.condition = threading.Condition()
+        self.frame = None
+        self.sequence = 0  # Increments with every published frame
+        self.timestamp = 0.0
+        self.viewers = 0
+
+    def publish(self, frame_bytes):
+        """Replace the latest frame and notify all viewers."""
+        with self.condition:
+            self.frame = frame_bytes
+            self.sequence += 1
+            self.timestamp = time.time()
+            self.condition.notify_all()
+
+    def write(self, buf):
+        """Receive one JPEG from the hardware MJPEG encoder's FileOutput."""
+        self.publish(bytes(buf))
+        return len(buf)
+
+    def wait_for_frame(self, last_sequence, timeout=1.0):
+        """Block until a frame newer than last_sequence exists; return (sequence, frame)."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.sequence != last_sequence, timeout)
+            return self.sequence, self.frame
+
+    def add_viewer(self):
+        with self.condition:
+            self.viewers += 1
+            self.condition.notify_all()
+
+    def remove_viewer(self):
+        with self.condition:
+            self.viewers -= 1
+
+    def wait_for_viewers(self):
+        """Block while nobody is watching, so the capture thread idles."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.viewers > 0)
+
+broadcaster = FrameBroadcaster()
+
+PREVIEW_SIZE = (1280, 720)
+STILL_SIZE = (4056, 3040)  # HQ camera photo resolution, kept as the running main stream
+SNAPSHOT_MAX_AGE = float(os.environ.get("SNAPSHOT_MAX_AGE", "1"))  # Seconds clients may cache /snapshot.jpg
+SERVER_STARTED = time.time()  # Keeps snapshot ETags unique across server restarts
+preview_encoder = None  # Hardware MJPEG encoder feeding the broadcaster, None when using software encoding
+
+def create_preview_config(main_size=PREVIEW_SIZE, **kwargs):
+    """RGB888 main stream for captures plus a YUV420 lores stream for the hardware MJPEG preview."""
+    # The lores stream shares the main stream's crop, so keep its aspect ratio
+    lores_size = (PREVIEW_SIZE[0], PREVIEW_SIZE[0] * main_size[1] // main_size[0] // 2 * 2)
+    return picam2.create_preview_configuration(
+        main={"format": "RGB888", "size": main_size},
+        lores={"format": "YUV420", "size": lores_size},
+        **kwargs
+    )
+
+def start_preview_encoder():
+    """Encode the lores stream with the hardware MJPEG encoder straight into the broadcaster."""
+    global preview_encoder
+    try:
+        encoder = MJPEGEncoder()
+        picam2.start_encoder(encoder, FileOutput(broadcaster), name="lores")
+        preview_encoder = encoder
+        print("Hardware MJPEG preview encoder started")
+    except Exception as e:
+        preview_encoder = None
+        print(f"Hardware MJPEG preview unavailable, falling back to software encoding: {e}")
 
-# Initialize camera
-try:
-    picam2 = Picamera2()
-    camera_info = picam2.camera_properties
-    camera_model = camera_info.get("Model", "")  # Store the camera model name
+def stop_preview_encoder():
+    """Stop the hardware preview encoder before the camera is stopped or reconfigured."""
+    global preview_encoder
+    if preview_encoder is not None:
+        try:
+            picam2.stop_encoder(preview_encoder)
+        except Exception as e:
+            print(f"Failed to stop preview encoder: {e}")
+        preview_encoder = None
+
+kit = None
+
+# Servo channel assignments
+TILT_SERVO = 0
+PAN_SERVO = 1
+ZOOM_SERVO = 2  # Only if using a zoom function
 
+# Default servo positions
+pan_angle = 90
+tilt_angle = 90
+zoom_level = 90
+
+def detect_servos():
+    """Check if servos are connected and initialize PCA9685 for servo control."""
+    global servos_found, kit
+    started = time.time()
+    try:
+        import board
+        import busio
+        from adafruit_pca9685 import PCA9685
+        i2c = busio.I2C(board.SCL, board.SDA)
+        pca = PCA9685(i2c)
+        pca.frequency = 50
+        pca.deinit()
+        from adafruit_servokit import ServoKit
+        kit = ServoKit(channels=16)
+        servos_found = True
+    except Exception as e:
+        print("Servos not found.")
+    boot_timings["servo_detection"] = time.time() - started
+
+# Servo detection talks to I2C only, so it runs while the camera initializes
+servo_thread = threading.Thread(target=detect_servos, daemon=True)
+servo_thread.start()
+
+camera_controls = None  # Anti-flicker/exposure controls measured at startup, reapplied on every camera reset
+os_is_bookworm = is_bookworm()
+
+capture_latencies = deque(maxlen=100)  # Recent trigger-to-exposure latencies of capture_photo, in ms
+
+def camera_config_kwargs():
+    """Rotation and cached controls for the camera configuration."""
+    kwargs = {}
+    if "64" in camera_model and os_is_bookworm:
+        kwargs["transform"] = libcamera.Transform(hflip=1, vflip=1)  # Rotate 180 degrees
+    if camera_controls is not None:
+        kwargs["controls"] = dict(camera_controls)  # Takes effect from the first frame
+    return kwargs
+
+def create_camera_preview_config():
+    """Preview configuration for the detected camera, rotated 180 degrees for the 64MP camera on Bookworm."""
+    # The HQ camera runs with a full-resolution main stream, so photos come from the running
+    # camera with no mode switch while the lores stream feeds the preview encoder
     if "64" in camera_model:
-        print("Arducam Hawkeye 64 MP Camera found.")
-        if is_bookworm():  # Only rotate if the OS is Bookworm
-            print("Detected Raspbian Bookworm. Applying 180-degree rotation.")
-            config = picam2.create_preview_configuration(
-                main={"format": "RGB888", "size": (1280, 720)},
-                transform=libcamera.Transform(hflip=1, vflip=1)  # Rotate 180 degrees
-            )
-        else:
-            print("Non-Bookworm OS detected. No rotation applied.")
-            config = picam2.create_preview_configuration(
-                main={"format": "RGB888", "size": (1280, 720)}
-            )
-        # Turn on Auto Focus for stream and video
-        picam2.set_controls({"AfMode": 1, "AfTrigger": 0})  # Assuming '1' enables Auto Focus
-    else:
-        print("Raspberry Pi HQ Camera found.")
-        # No rotation for other cameras
-        config = picam2.create_preview_configuration(
-            main={"format": "RGB888", "size": (1280, 720)}
-        )
+        return create_preview_config(**camera_config_kwargs())
+    # Two 12MP RGB buffers are enough for one capture at a time and keep CMA use down
+    return create_preview_config(main_size=STILL_SIZE, buffer_count=2, **camera_config_kwargs())
 
-    picam2.configure(config)
-    picam2.start()
-    
-    # Apply anti-flicker settings after camera starts (works for both camera types)
+def measure_anti_flicker_controls():
+    """Apply the anti-flicker settings, let exposure settle and return the controls to reuse on resets."""
+    applied = {}
     try:
         print("Applying anti-flicker settings...")
         # Let camera settle first
         time.sleep(1.0)
-        
+
         # Apply comprehensive anti-flicker settings
-        picam2.set_controls({
+        anti_flicker = {
             "AeEnable": True,
             "AeExposureMode": controls.AeExposureModeEnum.Normal,
             "AeMeteringMode": controls.AeMeteringModeEnum.Matrix,  # Use matrix metering for better scene adaptation
@@ -164,62 +346,106 @@ try:
             "Sharpness": 1.0,
             "Contrast": 1.0,  # Reset to neutral
             "Brightness": 0.0,  # Reset brightness to neutral
-        })
+        }
+        picam2.set_controls(anti_flicker)
+        applied.update(anti_flicker)
         print("Anti-flicker settings applied successfully")
         time.sleep(2.0)  # Give settings time to take effect
-        
+
         # For persistent banding issues, try manual exposure synchronized to power frequency
         try:
             # Get current auto-exposure result
             metadata = picam2.capture_metadata()
             current_exposure = metadata.get("ExposureTime", 16667)
-            
+
             # Calculate synchronized exposure (multiple of flicker period)
             flicker_period = 16667  # 60Hz - change to 20000 for 50Hz
             sync_exposure = round(current_exposure / flicker_period) * flicker_period
-            
+
             # Ensure reasonable exposure time - conservative settings to prevent overexposure
-            if sync_exposure < flicker_period * 1:  # Minimum 1x flicker period 
+            if sync_exposure < flicker_period * 1:  # Minimum 1x flicker period
                 sync_exposure = flicker_period * 1
             elif sync_exposure > flicker_period * 4:  # Lower cap to prevent overexposure
                 sync_exposure = flicker_period * 4
-                
+
             print(f"Setting synchronized manual exposure: {sync_exposure}μs (was {current_exposure}μs)")
-            
+
             # Apply manual exposure synchronized to power line frequency
-            picam2.set_controls({
+            manual_exposure = {
                 "AeEnable": False,
                 "ExposureTime": sync_exposure,
                 "AnalogueGain": 1.5  # Reduce gain to prevent overexposure
-            })
+            }
+            picam2.set_controls(manual_exposure)
+            applied.update(manual_exposure)
             time.sleep(1.0)
             print("Manual anti-flicker exposure applied")
-            
+
         except Exception as e:
             print(f"Manual exposure adjustment failed, using auto anti-flicker: {e}")
-            
+
     except Exception as e:
         print(f"Failed to apply anti-flicker settings: {e}")
-        
+    return applied
+
+def start_preview():
+    """Configure and start the preview, reusing the cached controls so no settling is needed."""
+    global camera_controls
+    picam2.configure(create_camera_preview_config())
+    if "64" in camera_model:
+        # Turn on Auto Focus for stream and video
+        picam2.set_controls({"AfMode": 1, "AfTrigger": 0})  # Assuming '1' enables Auto Focus
+    picam2.start()
+    start_preview_encoder()
+    if camera_controls is None:
+        camera_controls = measure_anti_flicker_controls()
+
+def reset_camera():
+    """Reopen the camera in-process after a recording released it and bring the preview back."""
+    global picam2
+    started = time.time()
+    try:
+        stop_preview_encoder()
+        if not picam2.is_open:
+            # rpicam-vid needed the camera, so picamera2 was closed for the recording
+            picam2 = Picamera2()
+        elif picam2.started:
+            picam2.stop()
+        start_preview()
+        print(f"Camera reset in {time.time() - started:.2f}s")
+        return True
+    except Exception as e:
+        print(f"Failed to reset camera: {e}")
+        return False
+
+# Initialize camera
+phase_started = time.time()
+try:
+    picam2 = Picamera2()
+    camera_info = picam2.camera_properties
+    camera_model = camera_info.get("Model", "")  # Store the camera model name
+
+    if "64" in camera_model:
+        print("Arducam Hawkeye 64 MP Camera found.")
+        if os_is_bookworm:  # Only rotate if the OS is Bookworm
+            print("Detected Raspbian Bookworm. Applying 180-degree rotation.")
+        else:
+            print("Non-Bookworm OS detected. No rotation applied.")
+    else:
+        print("Raspberry Pi HQ Camera found.")
+
+    start_preview()
+
     # Settings are now applied - no need for duplicate preview controls since manual exposure is active
     print("Camera initialization complete with optimized brightness settings")
 except Exception as e:
     print("Camera not found. Exiting.")
     exit(1)
+boot_timings["camera_init"] = time.time() - phase_started
 
-if servos_found:
-    # Initialize PCA9685 for servo control
-    kit = ServoKit(channels=16)
-
-    # Servo channel assignments
-    TILT_SERVO = 0
-    PAN_SERVO = 1
-    ZOOM_SERVO = 2  # Only if using a zoom function
-
-    # Default servo positions
-    pan_angle = 90
-    tilt_angle = 90
-    zoom_level = 90
+servo_thread.join()
+boot_timings["ready"] = time.time() - BOOT_STARTED
+print(f"Boot phases: {', '.join(f'{name} {seconds:.2f}s' for name, seconds in boot_timings.items())}")
 
 def set_servo_angle(channel, angle):
     """Clamp and set the servo angle between 0-180 degrees."""
@@ -294,10 +520,326 @@ def get_central_server_ip():
         print(f"Failed to determine host IP: {e}")
         return "192.168.10.100"  # Default to the original IP
 
+SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spool")
+CENTRAL_SERVER_USER = "chadfinnerty"
+CENTRAL_SERVER_PATH = "piCamControlOutput/"  # Replace with the actual path on the central server
+TRANSFER_MAX_ATTEMPTS = 5
+# "push" uploads spooled files with rsync; "pull" only serves them at /files for an ingest host
+TRANSFER_MODE = os.environ.get("TRANSFER_MODE", "push")
+
+def file_checksum(path):
+    """SHA-256 of a file, read in 1 MB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class TransferSpool:
+    """Spool directory plus journal, drained by a background worker that uploads to the central server."""
+
+    def __init__(self, spool_dir, upload=True):
+        self.spool_dir = spool_dir
+        self.journal_path = os.path.join(spool_dir, "journal.json")
+        self.condition = threading.Condition()
+        self.current = None  # Entry being uploaded
+        os.makedirs(spool_dir, exist_ok=True)
+        self.journal = self.load_journal()
+        # One thread hashes spooled files in order, so a file is never hashed twice
+        self.checksum_queue = queue.Queue()
+        for entry in self.journal["files"]:
+            if entry.get("sha256") is None:
+                self.checksum_queue.put(entry["name"])
+        threading.Thread(target=self.run_checksums, daemon=True).start()
+        if upload:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def load_journal(self):
+        """Load the journal, putting uploads interrupted by a restart back in the queue."""
+        try:
+            with open(self.journal_path) as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            journal = {"files": [], "completed": 0, "bytes_uploaded": 0, "upload_seconds": 0.0}
+        journal["files"] = [entry for entry in journal["files"]
+                            if os.path.exists(os.path.join(self.spool_dir, entry["name"]))]
+        for entry in journal["files"]:
+            if entry["status"] == "uploading":
+                entry["status"] = "pending"
+        return journal
+
+    def save_journal(self):
+        """Atomically write the journal. Callers hold the condition."""
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.journal, f, indent=2)
+        os.replace(temp_path, self.journal_path)
+
+    def enqueue(self, path, name=None):
+        """Move a finished file into the spool under name and queue it for upload."""
+        name = name or os.path.basename(path)
+        spool_path = os.path.join(self.spool_dir, name)
+        os.replace(path, spool_path)
+        with self.condition:
+            self.journal["files"].append({
+                "name": name,
+                "size": os.path.getsize(spool_path),
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt": 0.0,
+                "last_error": None,
+                "queued": time.time(),
+                "sha256": None,  # Filled in by the checksum thread
+            })
+            self.save_journal()
+            self.condition.notify_all()
+        self.checksum_queue.put(name)
+        print(f"Queued {name} for transfer to central server.")
+        return name
+
+    def run_checksums(self):
+        """Hash queued files once and store the SHA-256 in their journal entries."""
+        while True:
+            name = self.checksum_queue.get()
+            try:
+                checksum = file_checksum(os.path.join(self.spool_dir, name))
+            except OSError:
+                continue  # Uploaded or pulled before it was hashed
+            with self.condition:
+                for entry in self.journal["files"]:
+                    if entry["name"] == name:
+                        entry["sha256"] = checksum
+                        self.save_journal()
+
+    def files(self):
+        """Name, size and SHA-256 (None while pending) of every spooled file."""
+        with self.condition:
+            return [{"name": entry["name"], "size": entry["size"], "sha256": entry.get("sha256")}
+                    for entry in sorted(self.journal["files"], key=lambda entry: entry["name"])]
+
+    def has_file(self, name):
+        with self.condition:
+            return any(entry["name"] == name for entry in self.journal["files"])
+
+    def remove(self, name):
+        """Delete a spooled file once an ingest host has pulled it. False if it is being uploaded."""
+        with self.condition:
+            if self.current is not None and self.current["name"] == name:
+                return False
+            os.remove(os.path.join(self.spool_dir, name))
+            self.journal["files"] = [entry for entry in self.journal["files"] if entry["name"] != name]
+            self.save_journal()
+        print(f"{name} pulled by ingest host and deleted from local storage.")
+        return True
+
+    def next_entry(self):
+        """Block until a pending entry is due for upload and mark it as uploading."""
+        with self.condition:
+            while True:
+                now = time.time()
+                pending = [entry for entry in self.journal["files"] if entry["status"] == "pending"]
+                due = [entry for entry in pending if entry["next_attempt"] <= now]
+                if due:
+                    self.current = due[0]
+                    self.current["status"] = "uploading"
+                    self.save_journal()
+                    return self.current
+                self.condition.wait(min(entry["next_attempt"] for entry in pending) - now if pending else None)
+
+    def upload(self, path):
+        """Upload one file, appending to a partial upload left by an earlier attempt."""
+        destination = f"{CENTRAL_SERVER_USER}@{get_central_server_ip()}:{CENTRAL_SERVER_PATH}"
+        # --append-verify checks the whole-file checksum, so exit code 0 means a verified upload
+        command = ["rsync", "--partial", "--append-verify", "--timeout=60", path, destination]
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            error = result.stderr.decode("utf-8", "replace").strip()
+            raise RuntimeError(error or f"rsync exited with code {result.returncode}")
+
+    def run(self):
+        """Upload queued files one at a time, deleting each only after a verified upload."""
+        while True:
+            entry = self.next_entry()
+            path = os.path.join(self.spool_dir, entry["name"])
+            started = time.time()
+            try:
+                self.upload(path)
+            except Exception as e:
+                with self.condition:
+                    entry["attempts"] += 1
+                    entry["last_error"] = str(e)
+                    if entry["attempts"] >= TRANSFER_MAX_ATTEMPTS:
+                        entry["status"] = "failed"
+                        print(f"Giving up on transferring {entry['name']} after {entry['attempts']} attempts: {e}")
+                    else:
+                        entry["status"] = "pending"
+                        entry["next_attempt"] = time.time() + min(60, 2 ** entry["attempts"])
+                        print(f"Transfer of {entry['name']} failed (attempt {entry['attempts']}), retrying: {e}")
+                    self.current = None
+                    self.save_journal()
+                continue
+
+            seconds = time.time() - started
+            os.remove(path)
+            with self.condition:
+                self.journal["files"].remove(entry)
+                self.journal["completed"] += 1
+                self.journal["bytes_uploaded"] += entry["size"]
+                self.journal["upload_seconds"] += seconds
+                self.current = None
+                self.save_journal()
+            print(f"{entry['name']} transferred to central server in {seconds:.1f}s and deleted from local storage.")
+
+    def retry_failed(self):
+        """Put files that ran out of attempts back in the queue."""
+        with self.condition:
+            failed = [entry for entry in self.journal["files"] if entry["status"] == "failed"]
+            for entry in failed:
+                entry.update(status="pending", attempts=0, next_attempt=0.0)
+            self.save_journal()
+            self.condition.notify_all()
+        return len(failed)
+
+    def status(self):
+        """Queue depth, current upload, failures and throughput."""
+        with self.condition:
+            queued = [entry for entry in self.journal["files"] if entry["status"] != "failed"]
+            failed = [entry for entry in self.journal["files"] if entry["status"] == "failed"]
+            upload_seconds = self.journal["upload_seconds"]
+            return {
+                "queue_depth": len(queued),
+                "queued_bytes": sum(entry["size"] for entry in queued),
+                "uploading": self.current["name"] if self.current else None,
+                "failed": [{"name": entry["name"], "error": entry["last_error"]} for entry in failed],
+                "completed": self.journal["completed"],
+                "bytes_uploaded": self.journal["bytes_uploaded"],
+                "throughput_mb_s": self.journal["bytes_uploaded"] / upload_seconds / 1e6 if upload_seconds else None,
+            }
+
+transfer_spool = TransferSpool(SPOOL_DIR, upload=TRANSFER_MODE == "push")
+
+# Segment length for rpicam-vid recordings; 0 records one video.mjpeg as before
+RECORD_SEGMENT_SECONDS = float(os.environ.get("RECORD_SEGMENT_SECONDS", "0"))
+SEGMENT_DIR = "segments"  # Each segmented take records into its own SEGMENT_DIR/<take> directory
+
+def count_jpeg_frames(path):
+    """Count the JPEG frames in an MJPEG file by their start-of-image markers."""
+    if os.path.getsize(path) == 0:
+        return 0
+    frames = 0
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        position = mm.find(b"\xff\xd8\xff")
+        while position != -1:
+            frames += 1
+            position = mm.find(b"\xff\xd8\xff", position + 3)
+    return frames
+
+class SegmentWatcher:
+    """Split a segmented rpicam-vid take into per-segment PTS files and queue each closed segment."""
+
+    def __init__(self, take_name, watch=True):
+        self.take_name = take_name
+        self.take_dir = os.path.join(SEGMENT_DIR, take_name)
+        self.pts_path = os.path.join(self.take_dir, "timestamp.pts")
+        self.progress_path = os.path.join(self.take_dir, "progress.json")
+        self.segments = 0  # Segments queued so far
+        self.frames = 0  # PTS lines consumed by queued segments
+        os.makedirs(self.take_dir, exist_ok=True)
+        if os.path.exists(self.progress_path):
+            # A take left behind by a crash continues its numbering and PTS offset
+            with open(self.progress_path) as f:
+                progress = json.load(f)
+            self.segments, self.frames = progress["segments"], progress["frames"]
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        if watch:
+            self.thread.start()
+
+    def pending_segments(self):
+        return sorted(f for f in os.listdir(self.take_dir) if f.startswith("segment_") and f.endswith(".mjpeg"))
+
+    def read_pts(self):
+        """Timestamp lines rpicam-vid has written so far."""
+        try:
+            with open(self.pts_path) as f:
+                return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        except OSError:
+            return []
+
+    def queue_segment(self, segment, final=False):
+        """Write the segment's PTS file, then queue the segment and its PTS for transfer."""
+        segment_path = os.path.join(self.take_dir, segment)
+        frames = count_jpeg_frames(segment_path)
+        pts = self.read_pts()
+        # rpicam-vid writes timestamps as frames are encoded, so they can trail the closed segment briefly
+        while not final and len(pts) < self.frames + frames and not self.stop_event.wait(0.1):
+            pts = self.read_pts()
+        if self.stop_event.is_set():
+            # Stopped while waiting: rpicam-vid has exited by now, so the PTS file is complete
+            pts = self.read_pts()
+        segment_pts = pts[self.frames:] if final else pts[self.frames:self.frames + frames]
+
+        self.segments += 1
+        name = f"{self.take_name}_seg{self.segments:04d}"
+        pts_path = os.path.join(self.take_dir, name + ".pts")
+        with open(pts_path, "w") as f:
+            f.write("# timecode format v2\n")
+            f.writelines(line + "\n" for line in segment_pts)
+        self.frames += len(segment_pts)
+        transfer_spool.enqueue(segment_path, name + ".mjpeg")
+        transfer_spool.enqueue(pts_path)
+        with open(self.progress_path, "w") as f:
+            json.dump({"segments": self.segments, "frames": self.frames}, f)
+        print(f"Segment {name} closed with {frames} frames and queued for transfer.")
+
+    def run(self):
+        """While recording, every segment but the newest is closed and can be queued."""
+        while not self.stop_event.wait(0.5):
+            try:
+                segments = self.pending_segments()
+                for segment in segments[:-1]:
+                    self.queue_segment(segment)
+            except Exception as e:
+                print(f"Failed to queue recording segment: {e}")
+
+    def finish(self):
+        """After rpicam-vid has exited: queue the remaining segments and the take's segment manifest."""
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        segments = self.pending_segments()
+        for i, segment in enumerate(segments):
+            self.queue_segment(segment, final=i == len(segments) - 1)
+        if self.segments:
+            manifest_path = os.path.join(self.take_dir, f"{self.take_name}.segments.json")
+            with open(manifest_path, "w") as f:
+                json.dump({"segments": self.segments, "frames": self.frames}, f)
+            transfer_spool.enqueue(manifest_path)
+        for path in (self.pts_path, self.progress_path):
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(self.take_dir)
+        return self.take_name
+
+def recover_segmented_takes():
+    """Queue the segments of takes left behind by a crashed server or rpicam-vid, under their own take."""
+    if not os.path.isdir(SEGMENT_DIR):
+        return
+    for take_name in sorted(os.listdir(SEGMENT_DIR)):
+        if os.path.isdir(os.path.join(SEGMENT_DIR, take_name)):
+            print(f"Recovering segments of interrupted take {take_name}")
+            try:
+                SegmentWatcher(take_name, watch=False).finish()
+            except Exception as e:
+                print(f"Failed to recover segments of {take_name}: {e}")
+
+segment_watcher = None  # SegmentWatcher of the segmented take being recorded
+last_segmented_take = None  # Name of the last segmented take, already queued for transfer
+
 @app.route('/record', methods=['POST'])
 def record():
     """Handle start, stop recording, and transfer video requests."""
-    global recording_process, is_recording
+    global recording_process, is_recording, segment_watcher, last_segmented_take
     data = request.get_json()
     action = data.get("action")
 
@@ -312,6 +854,7 @@ def record():
                     current_resolution = current_config["main"]["size"] if current_config else None
 
                     if current_resolution != desired_resolution:
+                        stop_preview_encoder()
                         if picam2.started:
                             picam2.stop()
 
@@ -330,6 +873,7 @@ def record():
                     video_output = "video.mjpeg"
                     pts_output = "timestamp.pts"
                     # Stop picamera2 to release the camera resource
+                    stop_preview_encoder()
                     if picam2.started:
                         picam2.stop()
                     picam2.close()  # Explicitly release the camera resources
@@ -350,6 +894,18 @@ def record():
                     else:
                         sync_flag = f"--sync={'server' if host_ip == '192.168.48.120' else 'client'}"
 
+                    segment_args = []
+                    if RECORD_SEGMENT_SECONDS > 0:
+                        # Closed segments are queued for transfer while the camera keeps rolling
+                        recover_segmented_takes()
+                        take_name = f"{socket.gethostname()}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                        segment_watcher = SegmentWatcher(take_name)
+                        video_output = os.path.join(segment_watcher.take_dir, "segment_%04d.mjpeg")
+                        pts_output = segment_watcher.pts_path
+                        # --flush writes each frame's PTS line as the frame is written, instead of
+                        # holding it in rpicam-vid's stdio buffer and delaying every closed segment
+                        segment_args = ["--segment", str(int(RECORD_SEGMENT_SECONDS * 1000)), "--flush"]
+
                     recording_process = subprocess.Popen([
                         "rpicam-vid",
                         "--output", video_output,
@@ -363,12 +919,21 @@ def record():
                         "--framerate", "24",
                         sync_flag,
                         "--timeout", "0",  # Disable the 5-second timeout
-                        "--save-pts", pts_output
+                        "--save-pts", pts_output,
+                        *segment_args
                     ])
 
                 return jsonify({"success": True, "message": "Recording started successfully."})
             except Exception as e:
+                if segment_watcher is not None:
+                    # Leave the take directory for recover_segmented_takes at the next start
+                    segment_watcher.stop_event.set()
+                    segment_watcher = None
                 print(f"Failed to start recording: {e}")
+                if recording_process is None and not is_recording:
+                    # The camera may already be stopped or closed for the recording; bring the
+                    # preview back so the node can still stream and take photos
+                    reset_camera()
                 return jsonify({"success": False, "error": str(e)})
         else:
             print("Recording is already in progress.")
@@ -378,15 +943,25 @@ def record():
         if is_recording or recording_process is not None:
             try:
                 print("Stopping video recording...")
-                if "64" in camera_model and is_recording:
-                    # Stop recording with picamera2
-                    picam2.stop_recording()
-                    is_recording = False  # Reset the recording flag
-                elif recording_process is not None:
-                    # Stop recording with rpicam-vid
-                    recording_process.send_signal(signal.SIGINT)  # Graceful stop
-                    recording_process.wait()
-                    recording_process = None
+                try:
+                    if "64" in camera_model and is_recording:
+                        # Stop recording with picamera2 (stop_recording stops every encoder)
+                        stop_preview_encoder()
+                        picam2.stop_recording()
+                        is_recording = False  # Reset the recording flag
+                    elif recording_process is not None:
+                        # Stop recording with rpicam-vid
+                        recording_process.send_signal(signal.SIGINT)  # Graceful stop
+                        recording_process.wait()
+                        recording_process = None
+                        if segment_watcher is not None:
+                            # Detach first: if finish() fails, the take directory is left for
+                            # recover_segmented_takes and the next take starts a fresh watcher
+                            watcher, segment_watcher = segment_watcher, None
+                            last_segmented_take = watcher.finish()
+                finally:
+                    # Bring the preview back in-process so the node is ready for the next take
+                    reset_camera()
 
                 # Wait until the video file is closed
                 video_output = "video.mjpeg" if "64" not in camera_model else "video.h264"
@@ -430,83 +1005,24 @@ def record():
             elif os.path.exists("video.h264"):
                 original_output = "video.h264"
                 ext = "h264"
+            elif last_segmented_take is not None:
+                # Segments were queued as they closed; nothing is left to hand over
+                take_name, last_segmented_take = last_segmented_take, None
+                return jsonify({"success": True, "message": f"Segments of {take_name} queued for transfer."})
             else:
                 return jsonify({"success": False, "error": "No video file found to transfer."})
 
-            # Rename the file to include the Raspberry Pi name and timestamp
+            # Queue the file under the Raspberry Pi name and timestamp; the spool uploads it in the background
             pi_name = socket.gethostname()
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            new_output = f"{pi_name}_{timestamp}.{ext}"
-            os.rename(original_output, new_output)
+            new_output = transfer_spool.enqueue(original_output, f"{pi_name}_{timestamp}.{ext}")
 
-            # If a .pts file exists, rename it to match the video file (but with .pts extension)
+            # If a .pts file exists, queue it to match the video file (but with .pts extension)
             pts_file = "timestamp.pts"
-            new_pts_file = f"{pi_name}_{timestamp}.pts"
             if os.path.exists(pts_file):
-                os.rename(pts_file, new_pts_file)
-            else:
-                new_pts_file = None
-
-            # Determine the central server IP
-            central_server_ip = get_central_server_ip()
-            central_server_path = "piCamControlOutput/"  # Replace with the actual path on the central server
-
-            # Transfer video file
-            scp_command = f"scp {new_output} chadfinnerty@{central_server_ip}:{central_server_path}"
-            os.system(scp_command)
-
-            # Transfer pts file if it exists
-            if new_pts_file:
-                scp_pts_command = f"scp {new_pts_file} chadfinnerty@{central_server_ip}:{central_server_path}"
-                os.system(scp_pts_command)
-
-            print(f"Video file {new_output} transferred to central server.")
-            if new_pts_file:
-                print(f"PTS file {new_pts_file} transferred to central server.")
-
-            # Delete the files after transfer
-            os.remove(new_output)
-            print(f"Video file {new_output} deleted from local storage.")
-            if new_pts_file:
-                os.remove(new_pts_file)
-                print(f"PTS file {new_pts_file} deleted from local storage.")
-
-            # Send a success response **before** restarting the server
-            response = jsonify({"success": True, "message": "Video transferred and deleted successfully."})
-            response.status_code = 200
-
-            # Restart the server after sending the response
-            def restart_server():
-                """Restart the server."""
-                print("Restarting server...")
-
-                if is_bookworm():
-                    print("Detected Raspbian Bookworm. Applying Bookworm-specific restart logic.")
-                    # Get the current process ID (PID)
-                    current_pid = os.getpid()
-                    print(f"Current process PID: {current_pid}")
-
-                    # Use a subprocess to restart the server after killing the current process
-                    python_executable = sys.executable
-                    script_path = sys.argv[0]
-
-                    # Start a new process to run the server
-                    subprocess.Popen([python_executable, script_path])
-
-                    # Allow some time for the new process to start
-                    time.sleep(2)
-
-                    # Terminate the current process
-                    os.kill(current_pid, signal.SIGTERM)
-                else:
-                    print("Non-Bookworm OS detected. Using standard restart logic.")
-                    os.execv(sys.executable, ['python'] + sys.argv)
+                transfer_spool.enqueue(pts_file, f"{pi_name}_{timestamp}.pts")
 
-            # Use a background thread to restart the server
-            import threading
-            threading.Thread(target=restart_server).start()
-
-            return response
+            return jsonify({"success": True, "message": f"Video {new_output} queued for transfer."})
         except Exception as e:
             print(f"Failed to transfer video: {e}")
             return jsonify({"success": False, "error": str(e)})
@@ -525,138 +1041,56 @@ def take_photo():
         return jsonify({"success": False, "error": "Unknown action"})
 
 def capture_photo():
-    """Capture a photo and save it locally."""
-    current_resolution = None  # Initialize to avoid UnboundLocalError
+    """Capture a photo from the running camera and save it locally."""
+    trigger_ns = time.monotonic_ns()  # Same clock as libcamera's SensorTimestamp
     try:
-        # Determine the desired resolution based on the camera type
-        if "64" in camera_model:
-            # Arducam Hawkeye 64 MP Camera - keep original resolution
-            desired_resolution = (1280, 720)
-        else:
-            # Raspberry Pi HQ Camera
-            desired_resolution = (4056, 3040)
-
-        # Check if the current configuration matches the desired resolution
-        current_config = picam2.camera_configuration()  # Call the method to get the configuration
-        current_resolution = current_config["main"]["size"] if current_config else None
-
-        if current_resolution != desired_resolution:
-            # Stop the camera before reconfiguring
-            if picam2.started:
-                picam2.stop()
-
-            # Create and apply the still configuration with high quality settings
-            config = picam2.create_still_configuration(
-                main={"size": desired_resolution, "format": "RGB888"},
-                buffer_count=1
-            )
-            picam2.configure(config)
-
-            # Restart the camera
-            picam2.start()
-
-        # ---- Use the existing anti-flicker settings ----
-        # Camera already has optimized settings applied at startup
-        try:
-            time.sleep(0.5)  # Brief wait for stability
-        except Exception:
-            pass
+        # The main stream already runs at photo resolution (4056x3040 on the HQ camera, the original
+        # 1280x720 on the Arducam Hawkeye 64 MP Camera), so the first frame exposed after the trigger
+        # is the photo; the preview keeps running from the lores stream. flush=trigger_ns skips frames
+        # whose exposure started before the trigger, which would otherwise predate the shutter command
+        capture = picam2.capture_request(flush=trigger_ns)
 
         # Capture the photo with original filename format
         photo_filename = "photo.png"
-        picam2.capture_file(photo_filename)
+        try:
+            metadata = capture.get_metadata()
+            image = capture.make_image("main")  # Copy, so the buffer goes back to the camera before encoding
+        finally:
+            capture.release()
+        image.save(photo_filename)
         print(f"Photo captured: {photo_filename}")
 
+        latency_ms = None
+        if "SensorTimestamp" in metadata:
+            latency_ms = (metadata["SensorTimestamp"] - trigger_ns) / 1e6
+            capture_latencies.append(latency_ms)
+            print(f"Trigger-to-exposure latency: {latency_ms:.1f} ms")
+
         # Rename the photo file to include the Raspberry Pi name and timestamp
         pi_name = socket.gethostname()
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         new_photo_filename = f"{pi_name}_{timestamp}.png"
         os.rename(photo_filename, new_photo_filename)
 
-        return jsonify({"success": True, "message": "Photo captured successfully.", "filename": new_photo_filename})
+        return jsonify({"success": True, "message": "Photo captured successfully.", "filename": new_photo_filename,
+                        "latency_ms": latency_ms})
     except Exception as e:
         print(f"Failed to capture photo: {e}")
         return jsonify({"success": False, "error": str(e)})
-    finally:
-        # Restore the preview configuration if it was changed
-        if current_resolution != desired_resolution:
-            if picam2.started:
-                picam2.stop()
-            preview_config = picam2.create_preview_configuration(
-                main={"format": "RGB888", "size": (1280, 720)}
-            )
-            picam2.configure(preview_config)
-            picam2.start()
-            
-            # Re-apply the optimized anti-flicker settings
-            try:
-                # Apply same settings as startup
-                picam2.set_controls({
-                    "AeEnable": True,
-                    "AeExposureMode": controls.AeExposureModeEnum.Normal,
-                    "AeMeteringMode": controls.AeMeteringModeEnum.Matrix,  # Use matrix metering for better scene adaptation
-                    "AeFlickerMode": controls.AeFlickerModeEnum.Manual,
-                    "AeFlickerPeriod": 16667,   # 60Hz period
-                    "AwbMode": controls.AwbModeEnum.Auto,
-                    "NoiseReductionMode": controls.draft.NoiseReductionModeEnum.HighQuality,
-                    "Sharpness": 1.0,
-                    "Contrast": 1.0,  # Reset to neutral
-                    "Brightness": 0.0,  # Reset brightness to neutral
-                })
-                time.sleep(0.5)
-                
-                # Reapply manual exposure if it was working
-                try:
-                    # Use the same logic as startup to calculate synchronized exposure
-                    metadata = picam2.capture_metadata()
-                    current_exposure = metadata.get("ExposureTime", 16667)
-                    
-                    flicker_period = 16667
-                    sync_exposure = round(current_exposure / flicker_period) * flicker_period
-                    
-                    # Apply same constraints as startup
-                    if sync_exposure < flicker_period * 1:
-                        sync_exposure = flicker_period * 1
-                    elif sync_exposure > flicker_period * 4:
-                        sync_exposure = flicker_period * 4
-                    
-                    picam2.set_controls({
-                        "AeEnable": False,
-                        "ExposureTime": sync_exposure,  # Use calculated sync_exposure, not fixed value
-                        "AnalogueGain": 1.5  # Match startup gain
-                    })
-                except Exception:
-                    pass  # Fall back to auto if manual fails
-                    
-                print("Optimized anti-flicker settings restored to preview")
-            except Exception as e:
-                print(f"Failed to restore optimized settings: {e}")
 
 def transfer_photo():
-    """Transfer the most recent photo to the central server."""
+    """Queue the most recent photo for transfer to the central server."""
     try:
         # Find the most recent photo file
         photo_files = [f for f in os.listdir('.') if f.endswith('.png') and '_' in f]
         if not photo_files:
             return jsonify({"success": False, "error": "No photo file found to transfer."})
-        
+
         # Get the most recent photo file
         photo_files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-        photo_filename = photo_files[0]
-
-        # Determine the central server IP
-        central_server_ip = get_central_server_ip()
-        central_server_path = "piCamControlOutput/"  # Replace with the actual path on the central server
-        scp_command = f"scp {photo_filename} chadfinnerty@{central_server_ip}:{central_server_path}"
-        os.system(scp_command)
-
-        print(f"Photo file {photo_filename} transferred to central server.")
+        photo_filename = transfer_spool.enqueue(photo_files[0])
 
-        # Delete the photo file after transfer
-        os.remove(photo_filename)
-        print(f"Photo file {photo_filename} deleted from local storage.")
-
-        return jsonify({"success": True, "message": "Photo transferred and deleted successfully."})
+        return jsonify({"success": True, "message": f"Photo {photo_filename} queued for transfer."})
     except Exception as e:
         print(f"Failed to transfer photo: {e}")
         return jsonify({"success": False, "error": str(e)})
@@ -740,23 +1174,45 @@ def convert_to_mp4(h264_file, mp4_file):
         print(f"Error during conversion: {e}")
         return False
 
-def generate_frames():
-    """Continuously capture frames from the camera and stream via Flask."""
-    print("Starting video stream...")
+def capture_preview_frames():
+    """Software fallback: capture and JPEG-encode preview frames once, for all /video_feed viewers."""
     while True:
-        if picam2 is not None:
-            #if "64" in camera_model:
-                #picam2.set_controls({"AfMode": 1 ,"AfTrigger": 0})  # Ensure Auto Focus is on
-            frame = picam2.capture_array()
-            _, buffer = cv2.imencode('.jpg', frame)
-            frame_bytes = buffer.tobytes()
+        broadcaster.wait_for_viewers()
+        # The camera is closed while rpicam-vid records and briefly stopped while reconfiguring;
+        # the hardware encoder publishes frames itself whenever it is running
+        if picam2 is None or not picam2.started or preview_encoder is not None:
+            time.sleep(0.1)
+            continue
+        try:
+            import cv2  # Only the software fallback needs OpenCV
+            # The main stream can be full resolution, so encode the lores stream like the hardware path
+            frame = cv2.cvtColor(picam2.capture_array("lores"), cv2.COLOR_YUV420p2BGR)
+            ok, buffer = cv2.imencode('.jpg', frame)
+        except Exception as e:
+            print(f"Preview capture failed: {e}")
+            time.sleep(0.1)
+            continue
+        if ok:
+            broadcaster.publish(buffer.tobytes())
+
+threading.Thread(target=capture_preview_frames, daemon=True).start()
 
+def generate_frames():
+    """Stream the broadcaster's frames to one viewer as they are published."""
+    print("Starting video stream...")
+    broadcaster.add_viewer()
+    try:
+        sequence = 0
+        while True:
+            new_sequence, frame_bytes = broadcaster.wait_for_frame(sequence)
+            if new_sequence == sequence or frame_bytes is None:
+                continue  # No new frame yet, e.g. while the camera is recording
+            sequence = new_sequence
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        else:
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + b'\r\n')
-    print("Stopping video stream...")
+    finally:
+        broadcaster.remove_viewer()
+        print("Stopping video stream...")
 
 @app.route('/video_feed')
 def video_feed():
@@ -764,10 +1220,87 @@ def video_feed():
     return Response(generate_frames(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/snapshot.jpg')
+def snapshot():
+    """Serve the latest preview frame from memory, with ETag/Last-Modified for cheap polling."""
+    with broadcaster.condition:
+        sequence, frame_bytes, timestamp = broadcaster.sequence, broadcaster.frame, broadcaster.timestamp
+    # The software fallback only captures while someone watches, so wake it for one frame if stale
+    if frame_bytes is None or (preview_encoder is None and time.time() - timestamp > SNAPSHOT_MAX_AGE):
+        broadcaster.add_viewer()
+        try:
+            broadcaster.wait_for_frame(sequence)
+        finally:
+            broadcaster.remove_viewer()
+        with broadcaster.condition:
+            sequence, frame_bytes, timestamp = broadcaster.sequence, broadcaster.frame, broadcaster.timestamp
+    if frame_bytes is None:
+        return Response("No preview frame available", status=503, mimetype='text/plain')
+
+    response = Response(frame_bytes, mimetype='image/jpeg')
+    response.set_etag(f"{SERVER_STARTED:.0f}-{sequence}")
+    response.last_modified = datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+    response.cache_control.max_age = int(SNAPSHOT_MAX_AGE)
+    response.headers["Access-Control-Allow-Origin"] = "*"  # Polled by the central dashboard
+    return response.make_conditional(request)
+
+@app.route('/transfer_status', methods=['GET'])
+def transfer_status():
+    """Endpoint to get the transfer spool's queue depth, failures and throughput."""
+    return jsonify(transfer_spool.status())
+
+@app.route('/transfer_retry', methods=['POST'])
+def transfer_retry():
+    """Endpoint to re-queue transfers that ran out of attempts."""
+    return jsonify({"success": True, "requeued": transfer_spool.retry_failed()})
+
+@app.route('/files', methods=['GET'])
+def list_files():
+    """Endpoint to list finished takes waiting in the spool, with size and SHA-256 (null until hashed)."""
+    return jsonify({"files": transfer_spool.files()})
+
+@app.route('/files/<name>', methods=['GET'])
+def download_file(name):
+    """Endpoint to download a spooled file, with Range and conditional request support."""
+    if not transfer_spool.has_file(name):
+        return jsonify({"success": False, "error": "No such file."}), 404
+    return send_from_directory(SPOOL_DIR, name, as_attachment=True, conditional=True)
+
+@app.route('/files/<name>', methods=['DELETE'])
+def delete_file(name):
+    """Endpoint for an ingest host to delete a file after a verified pull."""
+    if not transfer_spool.has_file(name):
+        return jsonify({"success": False, "error": "No such file."}), 404
+    if not transfer_spool.remove(name):
+        return jsonify({"success": False, "error": "File is being uploaded."}), 409
+    return jsonify({"success": True})
+
+@app.route('/capture_latency', methods=['GET'])
+def capture_latency():
+    """Endpoint to get trigger-to-exposure latency statistics of recent photos, in milliseconds."""
+    latencies = list(capture_latencies)
+    if not latencies:
+        return jsonify({"count": 0})
+    return jsonify({
+        "count": len(latencies),
+        "last": latencies[-1],
+        "mean": sum(latencies) / len(latencies),
+        "min": min(latencies),
+        "max": max(latencies),
+    })
+
 @app.route('/hostname', methods=['GET'])
 def hostname():
     """Endpoint to get the hostname of the Raspberry Pi."""
+    if "first_hostname_response" not in boot_timings:
+        boot_timings["first_hostname_response"] = time.time() - BOOT_STARTED
+        print(f"First /hostname response {boot_timings['first_hostname_response']:.2f}s after start")
     return jsonify({"hostname": socket.gethostname()})
 
+@app.route('/boot_status', methods=['GET'])
+def boot_status():
+    """Endpoint to report how long each boot phase took, in seconds."""
+    return jsonify(boot_timings)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False)
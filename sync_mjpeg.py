@@ -4,52 +4,42 @@ import numpy as np
 import cv2
 import os
 
+from sync_mjpeg_batch import load_frame_index, load_pts, open_mjpeg, stream_synced_frames
+
 
 def resync_video_with_pts(mjpeg_path, pts_path, output_path, master_pts, target_fps=24, debug=False):
     # Load PTS and normalize to start at 0
-    pts = np.loadtxt(pts_path)
-    pts -= pts[0]
+    frame_index = load_frame_index(mjpeg_path, pts_path, debug)
+    if len(frame_index["pts"]) == 0:
+        raise RuntimeError("No frames read from input video.")
+    pts = frame_index["pts"] - frame_index["pts"][0]
 
     # Normalize master_pts to start at 0
     master_pts = master_pts - master_pts[0]
 
     # Open MJPEG video
-    cap = cv2.VideoCapture(mjpeg_path)
+    mm = open_mjpeg(mjpeg_path)
     if debug:
         print(f"[DEBUG] Opened video: {mjpeg_path}")
 
-    # Read all frames into memory using robust loop
-    frames = []
-    frame_index = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            if debug:
-                print(f"[DEBUG] End of video stream at frame {frame_index}")
-            break
-        frames.append(frame)
-        frame_index += 1
-        if debug and frame_index % 50 == 0:
-            print(f"[DEBUG] Read frame {frame_index}")
-    cap.release()
-
-    if not frames:
-        raise RuntimeError("No frames read from input video.")
-
-    # Find closest matching frame indices to master timeline
+    # Find closest matching frame indices to master timeline; only the source
+    # frames they reference are decoded.
     indices = np.searchsorted(pts, master_pts)
-    indices = np.clip(indices, 0, len(frames) - 1)
+    indices = np.clip(indices, 0, len(pts) - 1)
 
     # Write out new synced video
-    height, width = frames[0].shape[:2]
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_path, fourcc, target_fps, (width, height))
-
-    for i, idx in enumerate(indices):
-        out.write(frames[idx])
+    out = None
+    for i, idx, frame in stream_synced_frames(mm, frame_index, indices, debug):
+        if out is None:
+            height, width = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            out = cv2.VideoWriter(output_path, fourcc, target_fps, (width, height))
+        out.write(frame)
         if debug and i % 50 == 0:
             print(f"[DEBUG] Writing frame {i} using source frame {idx}")
-    out.release()
+    mm.close()
+    if out is not None:
+        out.release()
 
     print(f"[✓] Synced video saved to {output_path}")
 
@@ -71,7 +61,7 @@ def main():
     if not os.path.exists(args.master):
         raise FileNotFoundError(f"Missing master PTS file: {args.master}")
 
-    master_pts = np.loadtxt(args.master)
+    master_pts = load_pts(args.master, args.debug)
     resync_video_with_pts(
         mjpeg_path=args.mjpeg,
         pts_path=args.pts,
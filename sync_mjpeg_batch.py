@@ -1,13 +1,628 @@
 #!/usr/bin/env python3
 import argparse
+import contextlib
+import hashlib
+import io
+import json
 import numpy as np
 import cv2
+import mmap
 import os
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
 
+# JPEG start/end-of-image markers. SOI is matched together with the first byte
+# of the following marker so stray 0xFFD8 pairs are less likely to match.
+JPEG_SOI = b'\xff\xd8\xff'
+JPEG_EOI = b'\xff\xd9'
 
-def resync_video_with_pts(mjpeg_path, pts_path, output_path, master_pts, target_fps=24, debug=False):
-    # Load PTS (do not normalize)
-    pts = np.loadtxt(pts_path)
+# Decoded frames a resync job may hold at once (current frame, the copy handed
+# to the encoder and the encoder's own buffer), used to size its memory cost.
+FRAMES_IN_FLIGHT = 3
+
+# Bump when the layout of the .idx frame index sidecar changes.
+FRAME_INDEX_VERSION = 2
+
+# Output arguments for each --codec of the ffmpeg encoder backend. "mjpeg"
+# muxes the camera's JPEG frames as they are, without decoding them.
+FFMPEG_CODEC_ARGS = {
+    "libx264": ["-c:v", "libx264", "-crf", "18", "-pix_fmt", "yuv420p"],
+    "libx265": ["-c:v", "libx265", "-crf", "20", "-pix_fmt", "yuv420p", "-tag:v", "hvc1"],
+    "prores": ["-c:v", "prores_ks", "-profile:v", "3", "-pix_fmt", "yuv422p10le"],
+    "mjpeg": ["-c:v", "copy"],
+}
+
+# cv2.imdecode flags that let libjpeg do the downscaling in its DCT stage,
+# which is several times cheaper than a full decode followed by a resize.
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# Segment files of a segmented take (server.py RECORD_SEGMENT_SECONDS), which
+# are joined into one <take>.mjpeg/.pts pair instead of being treated as cameras.
+SEGMENT_FILE_PATTERN = re.compile(r'_seg\d{4}\.(mjpeg|pts)$', re.IGNORECASE)
+
+# Files an image sequence export writes: frame_00001.png, frame_00001.part.png, ...
+SEQUENCE_FRAME_PATTERN = re.compile(r'frame_\d{5,}(\.part)?\.(png|jpg)$')
+
+# Per-camera status of a batch run, kept in --output_dir for resumable reruns.
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def scan_mjpeg_frames(mjpeg_path, start_offset=0, max_frames=None):
+    # Locate the JPEG frames of a raw MJPEG stream (as written by rpicam-vid)
+    # by their SOI/EOI markers, starting at byte start_offset and stopping
+    # once max_frames frames have been found. Returns (frame_ranges,
+    # reached_end) where frame_ranges is a list of (offset, length) byte
+    # ranges. A frame without EOI keeps its slot (so frame numbers stay in
+    # step with the PTS file) unless it is the truncated last one.
+    frame_ranges = []
+    with open(mjpeg_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return frame_ranges, True
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = mm.find(JPEG_SOI, start_offset)
+            while start != -1:
+                if max_frames is not None and len(frame_ranges) >= max_frames:
+                    return frame_ranges, False
+                next_start = mm.find(JPEG_SOI, start + 2)
+                limit = next_start if next_start != -1 else len(mm)
+                end = mm.rfind(JPEG_EOI, start + 2, limit)
+                if end != -1:
+                    frame_ranges.append((start, end + 2 - start))
+                elif next_start != -1:
+                    frame_ranges.append((start, next_start - start))
+                start = next_start
+    return frame_ranges, True
+
+
+def _parse_pts_text(data):
+    # Drop comment lines such as rpicam-vid's "# timecode format v2" header,
+    # then parse all numbers in one C-level call. Falls back to np.loadtxt
+    # (first column only) if the fast path hits anything unexpected,
+    # including a row with more than one column, which it would flatten.
+    if b'#' in data:
+        data = b'\n'.join(line for line in data.splitlines() if not line.lstrip().startswith(b'#'))
+    try:
+        if re.search(rb'\S[ \t,]+\S', data):
+            raise ValueError("multi-column PTS rows")
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            return np.fromstring(data.decode('ascii'), dtype=np.float64, sep=' ')
+    except (ValueError, UnicodeDecodeError, DeprecationWarning):
+        return np.loadtxt(io.BytesIO(data), comments='#', ndmin=1, usecols=0)
+
+
+def load_pts(pts_path, debug=False):
+    # Load a PTS file (rpicam-vid --save-pts output or a plain list of
+    # timestamps) as a float64 array. The parsed array is cached next to the
+    # source as <name>.pts.npz together with the source's size and mtime, and
+    # reused only while both still match exactly.
+    cache_path = pts_path + '.npz'
+    signature = np.array(_file_signature(pts_path), dtype=np.int64)
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cached:
+                if np.array_equal(cached["signature"], signature):
+                    if debug:
+                        print(f"[DEBUG] Using cached PTS {cache_path}")
+                    return cached["pts"]
+        except Exception as e:
+            print(f"[!] Ignoring unreadable PTS cache {cache_path}: {e}")
+
+    with open(pts_path, 'rb') as f:
+        pts = _parse_pts_text(f.read())
+
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, signature=signature, pts=pts)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"[!] Could not cache PTS {cache_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return pts
+
+
+def frame_index_path(mjpeg_path):
+    return mjpeg_path + '.idx'
+
+
+def _file_signature(path):
+    # (size, mtime_ns) used to invalidate cached sidecars, (-1, -1) if missing.
+    if path is None or not os.path.exists(path):
+        return -1, -1
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def load_frame_index(mjpeg_path, pts_path=None, debug=False, up_to=None):
+    # Return the frame index of an MJPEG file as a dict of arrays:
+    #   offsets/lengths - byte range of each JPEG frame in the file
+    #   pts             - matching timestamp per frame (only for frames that
+    #                     have one, so len(pts) <= len(offsets))
+    # The index is cached next to the video as <name>.mjpeg.idx and rebuilt
+    # whenever the size or mtime of the video or its PTS file changes.
+    # With up_to set, the file is only scanned as far as frame up_to; such a
+    # partial index is cached too and extended from its end when a later run
+    # needs frames beyond it.
+    idx_path = frame_index_path(mjpeg_path)
+    signature = np.array([FRAME_INDEX_VERSION, *_file_signature(mjpeg_path), *_file_signature(pts_path)], dtype=np.int64)
+
+    offsets = np.empty(0, dtype=np.uint64)
+    lengths = np.empty(0, dtype=np.uint32)
+    if os.path.exists(idx_path):
+        try:
+            with np.load(idx_path) as cached:
+                if np.array_equal(cached["signature"], signature):
+                    offsets, lengths = cached["offsets"], cached["lengths"]
+                    if bool(cached["complete"]) or (up_to is not None and len(offsets) > up_to):
+                        if debug:
+                            print(f"[DEBUG] Using cached frame index {idx_path}")
+                        return {"offsets": offsets, "lengths": lengths, "pts": cached["pts"]}
+        except Exception as e:
+            print(f"[!] Ignoring unreadable frame index {idx_path}: {e}")
+
+    start_offset = int(offsets[-1]) + int(lengths[-1]) if len(offsets) else 0
+    max_frames = None if up_to is None else up_to + 1 - len(offsets)
+    if debug:
+        scope = "to the end" if max_frames is None else f"through frame {up_to}"
+        print(f"[DEBUG] Indexing {mjpeg_path} from byte {start_offset} {scope}")
+    frame_ranges, complete = scan_mjpeg_frames(mjpeg_path, start_offset, max_frames)
+    frame_ranges = np.array(frame_ranges, dtype=np.int64).reshape(-1, 2)
+    offsets = np.concatenate([offsets, frame_ranges[:, 0].astype(np.uint64)])
+    lengths = np.concatenate([lengths, frame_ranges[:, 1].astype(np.uint32)])
+    pts = load_pts(pts_path, debug) if pts_path is not None else np.empty(0)
+    frame_index = {
+        "offsets": offsets,
+        "lengths": lengths,
+        "pts": pts[:len(offsets)].astype(np.float64),
+    }
+
+    # Write to a temp file and rename so concurrent readers never see a partial
+    # index; a read-only input directory just means no caching.
+    tmp_path = f"{idx_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, signature=signature, complete=np.array(complete), **frame_index)
+        os.replace(tmp_path, idx_path)
+    except OSError as e:
+        print(f"[!] Could not cache frame index {idx_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return frame_index
+
+
+def map_master_to_frames(mjpeg_path, pts_path, master_pts, debug=False):
+    # Map the master timeline onto one camera. The source frame of every
+    # output frame is worked out from the PTS file alone, so the MJPEG only
+    # has to be indexed as far as the last frame the range references and
+    # exports can seek straight to the first one. Returns (frame_index, pts,
+    # indices).
+    pts = load_pts(pts_path, debug)
+    if len(pts) == 0:
+        raise RuntimeError("No frames read from input video.")
+    indices = np.clip(np.searchsorted(pts, master_pts), 0, len(pts) - 1)
+    last_needed = int(indices.max()) if len(indices) else 0
+    frame_index = load_frame_index(mjpeg_path, pts_path, debug, up_to=last_needed)
+    n_frames = len(frame_index["offsets"])
+    if n_frames == 0:
+        raise RuntimeError("No frames read from input video.")
+    if n_frames <= last_needed:
+        # The video holds fewer frames than its PTS file has timestamps
+        indices = np.minimum(indices, n_frames - 1)
+    if debug and len(indices):
+        print(f"[DEBUG] Master range maps to source frames {indices[0]}-{indices[-1]} "
+              f"(from byte {int(frame_index['offsets'][indices[0]])})")
+    return frame_index, pts, indices
+
+
+def read_frame_bytes(mm, frame_index, n):
+    # Zero-copy view of the JPEG bytes of frame n from an mmap of the video.
+    offset = int(frame_index["offsets"][n])
+    return memoryview(mm)[offset:offset + int(frame_index["lengths"][n])]
+
+
+def decode_frame(mm, frame_index, n, flags=cv2.IMREAD_COLOR):
+    # Decode frame n straight from an mmap of the video, without reading any
+    # of the frames before it.
+    buf = np.frombuffer(mm, dtype=np.uint8, count=int(frame_index["lengths"][n]), offset=int(frame_index["offsets"][n]))
+    return cv2.imdecode(buf, flags)
+
+
+def open_mjpeg(mjpeg_path):
+    # Read-only mmap of an MJPEG file. mmap keeps its own handle, so the file
+    # object can be closed straight away.
+    with open(mjpeg_path, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def stream_synced_frames(mm, frame_index, indices, debug=False, flags=cv2.IMREAD_COLOR, start=0):
+    # Decode only the source frames the master timeline references; frames the
+    # camera captured in between, or outside the exported range, are never
+    # touched. np.searchsorted over sorted PTS yields non-decreasing indices,
+    # so each referenced frame is decoded once and only the current one is
+    # held in memory. Yields (output_index, source_index, frame), beginning at
+    # output frame start.
+    indices = indices[start:]
+    if debug:
+        print(f"[DEBUG] Decoding {len(np.unique(indices))} of {len(frame_index['offsets'])} source frames")
+    frame = None
+    frame_idx = -1
+    attempted = -1
+    decoded_count = 0
+    for i, idx in enumerate(indices, start):
+        idx = int(idx)
+        if idx != attempted:
+            attempted = idx
+            decoded = decode_frame(mm, frame_index, idx, flags)
+            if decoded is not None:
+                frame = decoded
+                frame_idx = idx
+                decoded_count += 1
+                if debug and decoded_count % 50 == 0:
+                    print(f"[DEBUG] Decoded {decoded_count} source frames (at frame {idx})")
+            elif frame is None:
+                raise RuntimeError(f"Could not decode source frame {idx}.")
+            else:
+                print(f"[!] Could not decode source frame {idx}, repeating frame {frame_idx}")
+        yield i, frame_idx, frame
+
+
+def sequence_part_path(path):
+    # frame_00001.png -> frame_00001.part.png; cv2.imwrite picks the encoder
+    # from the extension, so it has to stay last.
+    root, ext = os.path.splitext(path)
+    return f"{root}.part{ext}"
+
+
+def completed_sequence_frames(output_path, total_frames):
+    # Number of leading output frames of a .pngseq/.jpegseq that already exist
+    # on disk. Frames are written under a .part name and renamed, so every
+    # frame found here is complete.
+    if output_path.endswith(".pngseq"):
+        img_dir, ext = output_path[:-7], ".png"
+    else:
+        img_dir, ext = output_path[:-8], ".jpg"
+    if not os.path.isdir(img_dir):
+        return 0
+    existing = set(os.listdir(img_dir))
+    done = 0
+    while done < total_frames and f"frame_{done+1:05d}{ext}" in existing:
+        done += 1
+    return done
+
+
+def clear_sequence_frames(output_path, parts_only=False):
+    # Remove the frames (and leftover .part files) of a .pngseq/.jpegseq that
+    # is about to be rebuilt with different parameters, so that neither
+    # completed_sequence_frames nor DuplicateLinker can mistake the previous
+    # run's frames for this one's. With parts_only, remove just the .part
+    # files an interrupted run left behind, which a resumed run may never
+    # rewrite since frames finish out of order. No-op for videos.
+    if output_path.endswith(".pngseq"):
+        img_dir = output_path[:-7]
+    elif output_path.endswith(".jpegseq"):
+        img_dir = output_path[:-8]
+    else:
+        return 0
+    if not os.path.isdir(img_dir):
+        return 0
+    removed = 0
+    for fname in os.listdir(img_dir):
+        match = SEQUENCE_FRAME_PATTERN.match(fname)
+        if match and (match.group(1) or not parts_only):
+            os.remove(os.path.join(img_dir, fname))
+            removed += 1
+    return removed
+
+
+class DuplicateLinker:
+    # Materialize duplicated sequence frames as links to the frame they
+    # repeat instead of encoding and writing the same image again: a hardlink
+    # where the filesystem allows it, else a relative symlink, else a copy.
+    # Each link is made as soon as its target has been written by this run
+    # (output frames before resume_from, or frames reported through
+    # written()), so an interrupted run resumes after the duplicates too
+    # instead of at the first missing link. A target left on disk by an
+    # earlier run is never linked to before it has been rewritten.
+
+    def __init__(self, resume_from=0):
+        self._pending = deque()  # (path, target_path, target_frame) in output order, same directory
+        self._resume_from = resume_from
+        self._written = set()
+        self.methods = {"hardlink": 0, "symlink": 0, "copy": 0}
+
+    def written(self, path):
+        # Called once path is complete under its final name; safe to call
+        # from the image writer threads.
+        self._written.add(path)
+
+    def add(self, path, target, target_frame):
+        self._pending.append((path, target, target_frame))
+        self.link_ready()
+
+    def link_ready(self):
+        while self._pending:
+            path, target, target_frame = self._pending[0]
+            if target_frame > self._resume_from and target not in self._written:
+                break
+            self._pending.popleft()
+            self._link(path, target)
+
+    def _link(self, path, target):
+        part_path = sequence_part_path(path)
+        if os.path.lexists(part_path):
+            os.remove(part_path)
+        try:
+            os.link(target, part_path)
+            self.methods["hardlink"] += 1
+        except OSError:
+            try:
+                os.symlink(os.path.basename(target), part_path)
+                self.methods["symlink"] += 1
+            except OSError:
+                shutil.copyfile(target, part_path)
+                self.methods["copy"] += 1
+        # os.replace is a no-op when path is already a hardlink of the same
+        # inode, which would leave the .part file behind.
+        if os.path.lexists(path):
+            os.remove(path)
+        os.replace(part_path, path)
+
+    def close(self):
+        # Call once every target has been written.
+        while self._pending:
+            path, target, _ = self._pending.popleft()
+            self._link(path, target)
+        linked = sum(self.methods.values())
+        if linked:
+            print(f"[✓] {linked} duplicate frames linked "
+                  f"({', '.join(f'{count} {method}' for method, count in self.methods.items() if count)})")
+
+
+class ImageSequenceWriter:
+    # Encodes and writes image sequence frames on a pool of threads. OpenCV
+    # releases the GIL inside cv2.imwrite, so PNG/JPEG compression and disk
+    # writes overlap with decoding on the calling thread. At most max_pending
+    # frames are queued at once; write() blocks beyond that so memory stays
+    # flat however far the decoder gets ahead. on_written(path) is called
+    # from the writer thread once a frame is complete under its final name.
+
+    def __init__(self, threads=None, max_pending=None, on_written=None):
+        self.threads = max(1, threads or os.cpu_count() or 1)
+        self.max_pending = max_pending or 2 * self.threads
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="imwrite")
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._error = None
+        self._on_written = on_written
+
+    def _write(self, path, frame, params):
+        # Encode under a .part name and rename, so a frame that exists under
+        # its final name is always complete (see completed_sequence_frames).
+        part_path = sequence_part_path(path)
+        if not cv2.imwrite(part_path, frame, params):
+            raise IOError(f"Failed to write {path}")
+        os.replace(part_path, path)
+        if self._on_written is not None:
+            self._on_written(path)
+
+    def _done(self, future):
+        if future.exception() is not None and self._error is None:
+            self._error = future.exception()
+        self._slots.release()
+
+    def write(self, path, frame, params=None):
+        if self._error is not None:
+            raise self._error
+        self._slots.acquire()
+        future = self._executor.submit(self._write, path, frame, list(params or []))
+        future.add_done_callback(self._done)
+
+    def close(self):
+        # Wait for every queued frame, then surface the first write error.
+        self._executor.shutdown(wait=True)
+        if self._error is not None:
+            raise self._error
+
+
+class FfmpegPipeWriter:
+    # Stand-in for cv2.VideoWriter that pipes frames into an ffmpeg subprocess.
+    # ffmpeg encodes in its own process and threads while the next frames are
+    # decoded here. With frame_size None the frames written are JPEG bytes,
+    # which ffmpeg reads with its MJPEG demuxer (used by the "mjpeg" codec).
+
+    def __init__(self, output_path, fps, frame_size, codec="libx264", preset="medium", threads=0):
+        if frame_size is None:
+            input_args = ["-f", "mjpeg", "-framerate", str(fps), "-i", "-"]
+        else:
+            width, height = frame_size
+            input_args = ["-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}",
+                          "-framerate", str(fps), "-i", "-"]
+        preset_args = ["-preset", preset] if codec in ("libx264", "libx265") else []
+        command = ["ffmpeg", "-y", "-loglevel", "error", *input_args, *FFMPEG_CODEC_ARGS[codec],
+                   *preset_args, "-threads", str(threads), output_path]
+        self.output_path = output_path
+        self._stderr = tempfile.TemporaryFile()
+        try:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=self._stderr)
+        except FileNotFoundError:
+            self._stderr.close()
+            raise RuntimeError("ffmpeg not found; install it or use --encoder opencv")
+
+    def _error_output(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode('utf-8', errors='replace').strip()
+
+    def write(self, frame):
+        try:
+            self._process.stdin.write(frame)
+        except BrokenPipeError:
+            self._process.wait()
+            raise RuntimeError(f"ffmpeg exited while encoding {self.output_path}: {self._error_output()}")
+
+    def release(self):
+        if self._process.stdin.closed:
+            return
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._process.wait()
+        error_output = self._error_output()
+        self._stderr.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed encoding {self.output_path}: {error_output}")
+
+
+def open_video_writer(output_path, fps, frame_size, encoder="opencv", codec="libx264", preset="medium", threads=0):
+    if encoder == "ffmpeg":
+        return FfmpegPipeWriter(output_path, fps, frame_size, codec, preset, threads)
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+    return cv2.VideoWriter(output_path, fourcc, fps, frame_size)
+
+
+def compute_alignment(pts, master_pts, indices):
+    # Alignment of the whole output timeline in one vectorized pass: the
+    # source frame and timestamp error of every output frame, which outputs
+    # repeat the previous source frame (and the 1-based output frame they
+    # duplicate, 0 if none) and how many source frames were skipped before
+    # each one.
+    indices = np.asarray(indices, dtype=np.int64)
+    camera_ts = pts[indices]
+    duplicate = np.zeros(len(indices), dtype=bool)
+    duplicate[1:] = indices[1:] == indices[:-1]
+    skipped = np.zeros(len(indices), dtype=np.int64)
+    skipped[1:] = np.maximum(np.diff(indices) - 1, 0)
+    # Output number of the first frame of each run of equal indices
+    run_start = np.maximum.accumulate(np.where(duplicate, 0, np.arange(1, len(indices) + 1)))
+    return {
+        "source_frame": indices,
+        "master_ts": master_pts,
+        "camera_ts": camera_ts,
+        "error": camera_ts - master_pts,
+        "duplicate": duplicate,
+        "duplicate_of": np.where(duplicate, run_start, 0),
+        "skipped": skipped,
+    }
+
+
+def summarize_alignment(alignment):
+    drift = np.abs(alignment["error"])
+    return {
+        "frames": int(len(drift)),
+        "max_drift": float(drift.max()) if len(drift) else 0.0,
+        "mean_drift": float(drift.mean()) if len(drift) else 0.0,
+        "duplicated": int(alignment["duplicate"].sum()),
+        "skipped": int(alignment["skipped"].sum()),
+    }
+
+
+def alignment_report_path(output_path):
+    # out/cam01/.pngseq -> out/cam01.alignment.csv, out/name.mp4 -> out/name.alignment.csv
+    if output_path.endswith(".pngseq") or output_path.endswith(".jpegseq"):
+        return os.path.normpath(os.path.dirname(output_path)) + ".alignment.csv"
+    return os.path.splitext(output_path)[0] + ".alignment.csv"
+
+
+def write_alignment_report(output_path, alignment):
+    # Write the per-frame alignment as CSV next to the output and print a
+    # one-line summary. Returns the summary dict.
+    report_path = alignment_report_path(output_path)
+    table = np.column_stack([
+        np.arange(1, len(alignment["source_frame"]) + 1),
+        alignment["source_frame"],
+        alignment["master_ts"],
+        alignment["camera_ts"],
+        alignment["error"],
+        alignment["duplicate"],
+        alignment["duplicate_of"],
+        alignment["skipped"],
+    ])
+    np.savetxt(report_path, table, delimiter=',', comments='',
+               header="output_frame,source_frame,master_ts,camera_ts,error,duplicate,duplicate_of,skipped_before",
+               fmt=['%d', '%d', '%.6f', '%.6f', '%.6f', '%d', '%d', '%d'])
+    summary = summarize_alignment(alignment)
+    print(f"[ALIGN] {summary['frames']} frames, max drift {summary['max_drift']:.6f}, "
+          f"mean drift {summary['mean_drift']:.6f}, {summary['duplicated']} duplicated, "
+          f"{summary['skipped']} skipped -> {report_path}")
+    return summary
+
+
+def export_jpeg_passthrough(mjpeg_path, pts_path, output_path, master_pts, debug=False, print_alignment=False,
+                            resume_from=0, dedupe=True):
+    # Write the selected MJPEG frames to a .jpegseq directory byte-for-byte,
+    # without decoding or re-encoding them.
+    frame_index, pts, indices = map_master_to_frames(mjpeg_path, pts_path, master_pts, debug)
+
+    if debug:
+        print(f"[DEBUG] Camera PTS: min={pts.min():.6f}, max={pts.max():.6f}, len={len(pts)}")
+        print(f"[DEBUG] Master PTS: min={master_pts.min():.6f}, max={master_pts.max():.6f}, len={len(master_pts)}")
+    if resume_from:
+        print(f"[→] Resuming at output frame {resume_from + 1}")
+
+    alignment = compute_alignment(pts, master_pts, indices)
+    summary = write_alignment_report(output_path, alignment)
+    duplicate_of = alignment["duplicate_of"] if dedupe else np.zeros(len(indices), dtype=np.int64)
+
+    def log_alignment(i, idx):
+        if print_alignment:
+            print(f"[ALIGN] Output frame {i+1:05d}: master_ts={master_pts[i]:.6f}  camera_ts={pts[idx]:.6f}  (cam_frame={idx})")
+
+    img_dir = output_path[:-8]
+    if not os.path.exists(img_dir):
+        os.makedirs(img_dir)
+    total_frames = len(indices)
+    last_percent = -1
+    duplicates = DuplicateLinker(resume_from)
+    with open(mjpeg_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for i, idx in enumerate(indices[resume_from:], resume_from):
+            log_alignment(i, idx)
+            img_path = os.path.join(img_dir, f"frame_{i+1:05d}.jpg")
+            if duplicate_of[i]:
+                duplicates.add(img_path, os.path.join(img_dir, f"frame_{duplicate_of[i]:05d}.jpg"), duplicate_of[i])
+                continue
+            part_path = sequence_part_path(img_path)
+            with read_frame_bytes(mm, frame_index, idx) as jpeg, open(part_path, 'wb') as img:
+                img.write(jpeg)
+            os.replace(part_path, img_path)
+            duplicates.written(img_path)
+            duplicates.link_ready()
+            percent = int((i + 1) / total_frames * 100)
+            if percent != last_percent and percent % 5 == 0:
+                print(f"    Progress: {percent}%", end='\r', flush=True)
+                last_percent = percent
+            if debug and i % 50 == 0:
+                print(f"[DEBUG] Copying JPEG frame {i} from source frame {idx}")
+    duplicates.close()
+    print("    Progress: 100%")
+    print(f"[✓] JPEG sequence saved to {img_dir}")
+    return summary
+
+
+def resync_video_with_pts(mjpeg_path, pts_path, output_path, master_pts, target_fps=24, debug=False,
+                          png_compression=None, jpeg_quality=100, writer_threads=None, print_alignment=False,
+                          resume_from=0, encoder="opencv", codec="libx264", preset="medium", encoder_threads=0,
+                          decode_scale=1, dedupe=True):
+    # Load PTS (do not normalize) and find the closest matching source frame
+    # for every frame of the master timeline. Only the part of the video the
+    # range needs gets indexed.
+    frame_index, pts, indices = map_master_to_frames(mjpeg_path, pts_path, master_pts, debug)
     # Do not normalize master_pts
 
     if debug:
@@ -15,120 +630,705 @@ def resync_video_with_pts(mjpeg_path, pts_path, output_path, master_pts, target_
         print(f"[DEBUG] Master PTS: min={master_pts.min():.6f}, max={master_pts.max():.6f}, len={len(master_pts)}")
 
     # Open MJPEG video
-    cap = cv2.VideoCapture(mjpeg_path)
+    mm = open_mjpeg(mjpeg_path)
     if debug:
         print(f"[DEBUG] Opened video: {mjpeg_path}")
 
-    # Read all frames into memory using robust loop
-    frames = []
-    frame_index = 0
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            if debug:
-                print(f"[DEBUG] End of video stream at frame {frame_index}")
-            break
-        frames.append(frame)
-        frame_index += 1
-        if debug and frame_index % 50 == 0:
-            print(f"[DEBUG] Read frame {frame_index}")
-    cap.release()
-
-    if not frames:
-        raise RuntimeError("No frames read from input video.")
+    # decode_scale 2/4/8 decodes every frame at that fraction of its size for
+    # proxy exports. Image sequences continue at output frame resume_from;
+    # MP4s are always written from the start.
+    flags = REDUCED_DECODE_FLAGS[decode_scale]
+    if resume_from:
+        print(f"[→] Resuming at output frame {resume_from + 1}")
 
-    # Find closest matching frame indices to master timeline
-    indices = np.searchsorted(pts, master_pts)
-    indices = np.clip(indices, 0, len(frames) - 1)
+    # Write out new synced video or PNG/JPEG sequence. In sequences, outputs
+    # that repeat the previous source frame become links to its file.
+    alignment = compute_alignment(pts, master_pts, indices)
+    summary = write_alignment_report(output_path, alignment)
+    duplicate_of = alignment["duplicate_of"] if dedupe else np.zeros(len(indices), dtype=np.int64)
 
-    # Write out new synced video or PNG/JPEG sequence
-    def print_alignment(i, idx):
-        print(f"[ALIGN] Output frame {i+1:05d}: master_ts={master_pts[i]:.6f}  camera_ts={pts[idx]:.6f}  (cam_frame={idx})")
+    def log_alignment(i, idx):
+        if print_alignment:
+            print(f"[ALIGN] Output frame {i+1:05d}: master_ts={master_pts[i]:.6f}  camera_ts={pts[idx]:.6f}  (cam_frame={idx})")
 
     if output_path.endswith(".pngseq"):
         img_dir = output_path[:-7]
         if not os.path.exists(img_dir):
             os.makedirs(img_dir)
+        png_params = [int(cv2.IMWRITE_PNG_COMPRESSION), png_compression] if png_compression is not None else None
         total_frames = len(indices)
         last_percent = -1
-        for i, idx in enumerate(indices):
-            print_alignment(i, idx)
-            img_path = os.path.join(img_dir, f"frame_{i+1:05d}.png")
-            cv2.imwrite(img_path, frames[idx])
-            percent = int((i + 1) / total_frames * 100)
-            if percent != last_percent and percent % 5 == 0:
-                print(f"    Progress: {percent}%", end='\r', flush=True)
-                last_percent = percent
-            if debug and i % 50 == 0:
-                print(f"[DEBUG] Exporting PNG frame {i} using source frame {idx}")
+        duplicates = DuplicateLinker(resume_from)
+        writer = ImageSequenceWriter(writer_threads, on_written=duplicates.written)
+        try:
+            for i, idx, frame in stream_synced_frames(mm, frame_index, indices, debug, flags, start=resume_from):
+                log_alignment(i, idx)
+                img_path = os.path.join(img_dir, f"frame_{i+1:05d}.png")
+                if duplicate_of[i]:
+                    duplicates.add(img_path, os.path.join(img_dir, f"frame_{duplicate_of[i]:05d}.png"), duplicate_of[i])
+                else:
+                    writer.write(img_path, frame, png_params)
+                    duplicates.link_ready()
+                percent = int((i + 1) / total_frames * 100)
+                if percent != last_percent and percent % 5 == 0:
+                    print(f"    Progress: {percent}%", end='\r', flush=True)
+                    last_percent = percent
+                if debug and i % 50 == 0:
+                    print(f"[DEBUG] Exporting PNG frame {i} using source frame {idx}")
+        finally:
+            writer.close()
+        duplicates.close()
         print("    Progress: 100%")
         print(f"[✓] PNG sequence saved to {img_dir}")
     elif output_path.endswith(".jpegseq"):
         img_dir = output_path[:-8]
         if not os.path.exists(img_dir):
             os.makedirs(img_dir)
+        jpeg_params = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
         total_frames = len(indices)
         last_percent = -1
-        for i, idx in enumerate(indices):
-            print_alignment(i, idx)
-            img_path = os.path.join(img_dir, f"frame_{i+1:05d}.jpg")
-            cv2.imwrite(img_path, frames[idx], [int(cv2.IMWRITE_JPEG_QUALITY), 100])
-            percent = int((i + 1) / total_frames * 100)
-            if percent != last_percent and percent % 5 == 0:
-                print(f"    Progress: {percent}%", end='\r', flush=True)
-                last_percent = percent
-            if debug and i % 50 == 0:
-                print(f"[DEBUG] Exporting JPEG frame {i} using source frame {idx}")
+        duplicates = DuplicateLinker(resume_from)
+        writer = ImageSequenceWriter(writer_threads, on_written=duplicates.written)
+        try:
+            for i, idx, frame in stream_synced_frames(mm, frame_index, indices, debug, flags, start=resume_from):
+                log_alignment(i, idx)
+                img_path = os.path.join(img_dir, f"frame_{i+1:05d}.jpg")
+                if duplicate_of[i]:
+                    duplicates.add(img_path, os.path.join(img_dir, f"frame_{duplicate_of[i]:05d}.jpg"), duplicate_of[i])
+                else:
+                    writer.write(img_path, frame, jpeg_params)
+                    duplicates.link_ready()
+                percent = int((i + 1) / total_frames * 100)
+                if percent != last_percent and percent % 5 == 0:
+                    print(f"    Progress: {percent}%", end='\r', flush=True)
+                    last_percent = percent
+                if debug and i % 50 == 0:
+                    print(f"[DEBUG] Exporting JPEG frame {i} using source frame {idx}")
+        finally:
+            writer.close()
+        duplicates.close()
         print("    Progress: 100%")
         print(f"[✓] JPEG sequence saved to {img_dir}")
     else:
-        height, width = frames[0].shape[:2]
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(output_path, fourcc, target_fps, (width, height))
+        out = None
         total_frames = len(indices)
         last_percent = -1
-        for i, idx in enumerate(indices):
-            print_alignment(i, idx)
-            out.write(frames[idx])
+        # With the ffmpeg "mjpeg" codec the camera's JPEG frames are muxed as
+        # they are, so nothing needs decoding.
+        copy_jpeg = encoder == "ffmpeg" and codec == "mjpeg" and decode_scale == 1
+        if copy_jpeg:
+            frames = ((i, int(idx), None) for i, idx in enumerate(indices))
+        else:
+            frames = stream_synced_frames(mm, frame_index, indices, debug, flags)
+        try:
+            for i, idx, frame in frames:
+                if out is None:
+                    # Even dimensions keep the frames valid for yuv420p/yuv422p
+                    # encoders; a 1/8 scaled decode of 4056x3040 is 507x380.
+                    frame_size = None if copy_jpeg else (frame.shape[1] // 2 * 2, frame.shape[0] // 2 * 2)
+                    out = open_video_writer(output_path, target_fps, frame_size, encoder, codec, preset, encoder_threads)
+                log_alignment(i, idx)
+                if copy_jpeg:
+                    with read_frame_bytes(mm, frame_index, idx) as jpeg:
+                        out.write(jpeg)
+                else:
+                    if frame.shape[1] != frame_size[0] or frame.shape[0] != frame_size[1]:
+                        frame = np.ascontiguousarray(frame[:frame_size[1], :frame_size[0]])
+                    out.write(frame)
+                percent = int((i + 1) / total_frames * 100)
+                if percent != last_percent and percent % 5 == 0:
+                    print(f"    Progress: {percent}%", end='\r', flush=True)
+                    last_percent = percent
+                if debug and i % 50 == 0:
+                    print(f"[DEBUG] Writing frame {i} using source frame {idx}")
+        finally:
+            if out is not None:
+                out.release()
+        print("    Progress: 100%")
+        print(f"[✓] Synced video saved to {output_path}")
+    mm.close()
+    return summary
+
+
+def proxy_output_path(output_path, scale):
+    # out/cam01/.pngseq -> out/cam01_proxy4/.pngseq, out/name.mp4 -> out/name_proxy4.mp4
+    if output_path.endswith(".pngseq") or output_path.endswith(".jpegseq"):
+        img_dir = os.path.normpath(os.path.dirname(output_path))
+        return os.path.join(f"{img_dir}_proxy{scale}", os.path.basename(output_path))
+    root, ext = os.path.splitext(output_path)
+    return f"{root}_proxy{scale}{ext}"
+
+
+def export_mosaic(jobs, master_pts, output_path, target_fps=24, scale=8, columns=None, debug=False,
+                  encoder="opencv", codec="libx264", preset="medium", encoder_threads=0):
+    # Tile every camera, synced to the master timeline, into one preview video
+    # in a single pass. Each camera is decoded at 1/scale straight into its
+    # tile of a canvas that is reused for every output frame, and only when
+    # its source frame changes, so memory is one canvas plus one tile.
+    cameras = []
+    for job in jobs:
+        try:
+            frame_index, _, indices = map_master_to_frames(job["mjpeg_path"], job["pts_path"], master_pts, debug)
+            cameras.append({"name": job["name"], "frame_index": frame_index, "indices": indices,
+                            "mm": open_mjpeg(job["mjpeg_path"]), "last_idx": -1})
+        except Exception as e:
+            print(f"[!] Leaving {job['name']} out of the mosaic: {e}")
+    if not cameras:
+        raise RuntimeError("No cameras available for the mosaic.")
+
+    size = jpeg_frame_size(jobs[0]["mjpeg_path"]) or (4056, 3040)
+    # Even tile sizes keep the canvas valid for yuv420p encoders
+    tile_w = -(-size[0] // scale) // 2 * 2
+    tile_h = -(-size[1] // scale) // 2 * 2
+    columns = columns or int(np.ceil(np.sqrt(len(cameras))))
+    rows = -(-len(cameras) // columns)
+    canvas = np.zeros((rows * tile_h, columns * tile_w, 3), dtype=np.uint8)
+    print(f"[→] Building {columns}x{rows} mosaic of {len(cameras)} cameras, tiles {tile_w}x{tile_h}")
+
+    flags = REDUCED_DECODE_FLAGS[scale]
+    out = open_video_writer(output_path, target_fps, (canvas.shape[1], canvas.shape[0]), encoder,
+                            "libx264" if codec == "mjpeg" else codec, preset, encoder_threads)
+    total_frames = len(master_pts)
+    last_percent = -1
+    try:
+        for i in range(total_frames):
+            for n, camera in enumerate(cameras):
+                idx = int(camera["indices"][i])
+                if idx == camera["last_idx"]:
+                    continue
+                camera["last_idx"] = idx
+                tile = decode_frame(camera["mm"], camera["frame_index"], idx, flags)
+                if tile is None:
+                    continue
+                if tile.shape[0] != tile_h or tile.shape[1] != tile_w:
+                    tile = cv2.resize(tile, (tile_w, tile_h), interpolation=cv2.INTER_AREA)
+                cv2.putText(tile, os.path.splitext(camera["name"])[0], (8, 24), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.6, (255, 255, 255), 1, cv2.LINE_AA)
+                row, col = divmod(n, columns)
+                canvas[row * tile_h:(row + 1) * tile_h, col * tile_w:(col + 1) * tile_w] = tile
+            out.write(canvas)
             percent = int((i + 1) / total_frames * 100)
             if percent != last_percent and percent % 5 == 0:
                 print(f"    Progress: {percent}%", end='\r', flush=True)
                 last_percent = percent
             if debug and i % 50 == 0:
-                print(f"[DEBUG] Writing frame {i} using source frame {idx}")
-        print("    Progress: 100%")
+                print(f"[DEBUG] Writing mosaic frame {i}")
+    finally:
         out.release()
-        print(f"[✓] Synced video saved to {output_path}")
+        for camera in cameras:
+            camera["mm"].close()
+    print("    Progress: 100%")
+    print(f"[✓] Mosaic preview saved to {output_path}")
+
+
+def jpeg_frame_size(mjpeg_path):
+    # Read (width, height) from the SOF header of the first frame in an MJPEG
+    # stream without decoding it. Returns None if no SOF marker is found.
+    with open(mjpeg_path, 'rb') as f:
+        data = f.read(1 << 16)
+    pos = data.find(JPEG_SOI)
+    if pos == -1:
+        return None
+    pos += 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        seg_len = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        # SOF0..SOF15, excluding DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            if pos + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        pos += 2 + seg_len
+    return None
+
+
+def estimate_job_memory(mjpeg_path, passthrough=False, queued_frames=0, decode_scale=1):
+    # Rough peak memory of one resync job in bytes. Passthrough only ever holds
+    # JPEG bytes, decoding jobs hold a few BGR frames (at 1/decode_scale size
+    # for proxy-only jobs) plus whatever the image sequence writer has queued.
+    if passthrough:
+        return 64 * 1024 * 1024
+    size = jpeg_frame_size(mjpeg_path)
+    width, height = size if size else (4056, 3040)
+    frame_bytes = (width // decode_scale) * (height // decode_scale) * 3
+    return frame_bytes * (FRAMES_IN_FLIGHT + queued_frames) + 128 * 1024 * 1024
+
+
+def default_memory_budget():
+    # Half of physical RAM, leaving headroom for the page cache and the OS.
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 2
+    except (ValueError, OSError, AttributeError):
+        return 8 * 1024 ** 3
+
+
+def pts_units_per_second(pts):
+    # rpicam-vid writes milliseconds, other tools seconds or microseconds.
+    # Pick the unit that makes the median frame interval a plausible rate.
+    intervals = np.diff(pts)
+    intervals = intervals[intervals > 0]
+    if len(intervals) == 0:
+        return 1e3
+    median_interval = float(np.median(intervals))
+    for units in (1.0, 1e3, 1e6, 1e9):
+        if 1.0 <= units / median_interval <= 1000.0:
+            return units
+    return 1e3
+
+
+def common_overlap_window(camera_pts):
+    # Latest start and earliest end over all cameras, i.e. the span every
+    # camera actually recorded. Returns None if the cameras never overlap.
+    starts = np.array([pts[0] for pts in camera_pts.values()])
+    ends = np.array([pts[-1] for pts in camera_pts.values()])
+    window_start, window_end = starts.max(), ends.min()
+    if window_start > window_end:
+        return None
+    return window_start, window_end
+
+
+def best_master_camera(camera_pts, window_start, window_end):
+    # The camera with the fewest dropped frames inside the window (gaps longer
+    # than 1.5x its median interval), ties broken by the most frames.
+    best_name, best_score = None, None
+    for name, pts in camera_pts.items():
+        inside = pts[(pts >= window_start) & (pts <= window_end)]
+        if len(inside) < 2:
+            continue
+        intervals = np.diff(inside)
+        drops = int(np.count_nonzero(intervals > 1.5 * np.median(intervals)))
+        score = (drops, -len(inside))
+        if best_score is None or score < best_score:
+            best_name, best_score = name, score
+    return best_name
+
+
+def auto_master_timeline(camera_pts, mode, fps, debug=False):
+    # Build the master timeline over the window all cameras overlap, either
+    # as an even grid at fps or as the best camera's own timestamps, so no
+    # camera has to be clamped to its first or last frame.
+    window = common_overlap_window(camera_pts)
+    if window is None:
+        raise RuntimeError("Cameras have no common recording window.")
+    window_start, window_end = window
+    if debug:
+        for name, pts in camera_pts.items():
+            print(f"[DEBUG] {name}: start={pts[0]:.6f} end={pts[-1]:.6f}")
+    if mode == "best":
+        name = best_master_camera(camera_pts, window_start, window_end)
+        if name is None:
+            raise RuntimeError("No camera has enough frames inside the common window.")
+        pts = camera_pts[name]
+        master_pts = pts[(pts >= window_start) & (pts <= window_end)]
+        print(f"[→] Using {name} as master: {len(master_pts)} frames in common window "
+              f"{window_start:.6f} - {window_end:.6f}")
+    else:
+        units = pts_units_per_second(next(iter(camera_pts.values())))
+        step = units / fps
+        master_pts = window_start + step * np.arange(int(np.floor((window_end - window_start) / step)) + 1)
+        print(f"[→] Built {len(master_pts)}-frame master timeline at {fps} fps over common window "
+              f"{window_start:.6f} - {window_end:.6f}")
+    return master_pts
+
+
+def run_camera_job(job, master_pts, options):
+    # Resync a single camera and return a result record instead of raising, so
+    # sequential and pooled runs report failures the same way.
+    started = time.time()
+    result = {"name": job["name"], "output_path": job["output_path"], "status": "ok", "error": None,
+              "alignment": job.get("alignment"), "completed_outputs": []}
+    try:
+        if job.get("resume_from", 0) >= len(master_pts):
+            print(f"[✓] {job['output_path']} is already complete")
+        elif options["passthrough"]:
+            result["alignment"] = export_jpeg_passthrough(
+                mjpeg_path=job["mjpeg_path"],
+                pts_path=job["pts_path"],
+                output_path=job["output_path"],
+                master_pts=master_pts,
+                debug=options["debug"],
+                print_alignment=options["print_alignment"],
+                resume_from=job.get("resume_from", 0),
+                dedupe=options["dedupe"]
+            )
+        else:
+            result["alignment"] = resync_video_with_pts(
+                mjpeg_path=job["mjpeg_path"],
+                pts_path=job["pts_path"],
+                output_path=job["output_path"],
+                master_pts=master_pts,
+                target_fps=options["fps"],
+                debug=options["debug"],
+                png_compression=options["png_compression"],
+                jpeg_quality=options["jpeg_quality"],
+                writer_threads=options["writer_threads"],
+                print_alignment=options["print_alignment"],
+                resume_from=job.get("resume_from", 0),
+                encoder=options["encoder"],
+                codec=options["codec"],
+                preset=options["preset"],
+                encoder_threads=options["encoder_threads"],
+                decode_scale=options["proxy_scale"] if options["proxy_only"] else 1,
+                dedupe=options["dedupe"]
+            )
+        result["completed_outputs"].append(job["output_path"])
+        if job.get("proxy_path") and job.get("proxy_resume_from", 0) < len(master_pts):
+            # Proxy alongside the full-resolution export: the frame index and
+            # the file's pages are already cached, and decoding at reduced
+            # scale costs a fraction of the full decode.
+            print(f"[→] Writing 1/{options['proxy_scale']} proxy to {job['proxy_path']}")
+            resync_video_with_pts(
+                mjpeg_path=job["mjpeg_path"],
+                pts_path=job["pts_path"],
+                output_path=job["proxy_path"],
+                master_pts=master_pts,
+                target_fps=options["fps"],
+                debug=options["debug"],
+                png_compression=options["png_compression"],
+                jpeg_quality=options["jpeg_quality"],
+                writer_threads=options["writer_threads"],
+                resume_from=job.get("proxy_resume_from", 0),
+                encoder=options["encoder"],
+                codec="libx264" if options["codec"] == "mjpeg" else options["codec"],
+                preset=options["preset"],
+                encoder_threads=options["encoder_threads"],
+                decode_scale=options["proxy_scale"],
+                dedupe=options["dedupe"]
+            )
+        if job.get("proxy_path"):
+            result["completed_outputs"].append(job["proxy_path"])
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    result["seconds"] = time.time() - started
+    return result
+
+
+# master_pts for pool workers, set once per process by _init_worker so it is
+# not pickled again for every submitted camera.
+_worker_master_pts = None
+
+
+def _init_worker(master_pts):
+    global _worker_master_pts
+    _worker_master_pts = master_pts
+
+
+def _run_camera_job_in_worker(job, options):
+    # Capture the worker's console output so it can be reported per camera
+    # rather than interleaved with the other workers.
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        result = run_camera_job(job, _worker_master_pts, options)
+    result["log"] = log.getvalue()
+    return result
+
+
+def run_jobs_parallel(jobs, master_pts, options, workers, memory_budget, on_result=None):
+    # Run camera jobs in a process pool, admitting a job only while the summed
+    # memory estimate of running jobs stays within memory_budget. A job larger
+    # than the whole budget is still run, but on its own. A worker process
+    # dying (e.g. killed by the OOM killer) breaks the pool and every job
+    # running in it; the pool is then rebuilt and those jobs are retried one
+    # at a time, so only a job that also crashes on its own is failed.
+    queued_frames = 2 * options["writer_threads"] if options["sequence"] else 0
+    decode_scale = options["proxy_scale"] if options["proxy_only"] else 1
+    # (job, memory estimate, run alone)
+    pending = deque((job, estimate_job_memory(job["mjpeg_path"], options["passthrough"], queued_frames, decode_scale), False)
+                    for job in jobs)
+    running = {}
+    results = []
+    in_use = 0
+
+    def new_pool():
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(master_pts,))
+
+    def finish(job, result):
+        results.append(result)
+        if on_result is not None:
+            on_result(job, result)
+        print(f"[{'✓' if result['status'] == 'ok' else '!'}] {job['name']} {result['status']} "
+              f"({len(results)}/{len(jobs)} done)")
+
+    def crashed(job, error):
+        return {"name": job["name"], "output_path": job["output_path"], "status": "failed",
+                "error": f"worker crashed: {error}", "seconds": 0.0, "log": "", "alignment": None}
+
+    executor = new_pool()
+    try:
+        while pending or running:
+            broken = False
+            while pending and len(running) < workers:
+                job, cost, alone = pending[0]
+                if running and (alone or in_use + cost > memory_budget
+                                or any(entry[2] for entry in running.values())):
+                    break
+                try:
+                    future = executor.submit(_run_camera_job_in_worker, job, options)
+                except BrokenProcessPool:
+                    broken = True
+                    break
+                pending.popleft()
+                running[future] = (job, cost, alone)
+                in_use += cost
+                print(f"[→] Syncing {job['name']} ({len(running)} running, {in_use / 1024 ** 3:.1f} GB reserved)")
+
+            if not broken:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, cost, alone = running[future]
+                    if isinstance(future.exception(), BrokenProcessPool):
+                        broken = True
+                        continue
+                    running.pop(future)
+                    in_use -= cost
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = crashed(job, e)
+                    finish(job, result)
+            if not broken:
+                continue
+
+            # Once one future reports the broken pool, all the others still
+            # running in it fail too. Collect them, fail a job that was
+            # running alone, and requeue the rest to run alone.
+            wait(running)
+            retry = []
+            for future, (job, cost, alone) in running.items():
+                error = future.exception()
+                if error is None:
+                    finish(job, future.result())
+                elif isinstance(error, BrokenProcessPool) and not alone:
+                    retry.append((job, cost, True))
+                else:
+                    finish(job, crashed(job, error))
+            if retry:
+                print(f"[!] A worker process died; retrying {', '.join(job['name'] for job, _, _ in retry)} one at a time")
+            pending.extendleft(reversed(retry))
+            running = {}
+            in_use = 0
+            executor.shutdown(wait=True)
+            executor = new_pool()
+    finally:
+        executor.shutdown(wait=True)
+    return results
+
+
+def load_manifest(output_dir):
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("version") == MANIFEST_VERSION:
+                return manifest
+            print(f"[!] Ignoring manifest {manifest_path} from another version")
+        except (OSError, ValueError) as e:
+            print(f"[!] Ignoring unreadable manifest {manifest_path}: {e}")
+    return {"version": MANIFEST_VERSION, "cameras": {}}
+
+
+def save_manifest(output_dir, manifest):
+    # Write-then-rename so an interrupted run never leaves a torn manifest.
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def job_parameters(job, master_hash, options, start, end):
+    # Everything that determines a camera's output. A change in any of these
+    # (including the input files themselves, and the camNN directory a camera
+    # lands in when the set of .mjpeg files changes) means the output is rebuilt.
+    if options["passthrough"]:
+        mode = "jpegseq-passthrough"
+    elif job["output_path"].endswith(".pngseq"):
+        mode = "pngseq"
+    elif job["output_path"].endswith(".jpegseq"):
+        mode = "jpegseq"
+    else:
+        mode = "mp4"
+    return {
+        "mode": mode,
+        "output_path": job["output_path"],
+        "proxy_path": job["proxy_path"],
+        "fps": options["fps"],
+        "start_frame": start,
+        "end_frame": end,
+        "master_hash": master_hash,
+        "png_compression": options["png_compression"] if mode == "pngseq" else None,
+        "jpeg_quality": options["jpeg_quality"] if mode == "jpegseq" else None,
+        "encoder": [options["encoder"], options["codec"], options["preset"]] if mode == "mp4" else None,
+        "proxy": [options["proxy_scale"], options["proxy_only"]],
+        "dedupe": options["dedupe"] if mode != "mp4" else None,
+        "mjpeg": list(_file_signature(job["mjpeg_path"])),
+        "pts": list(_file_signature(job["pts_path"])),
+    }
+
+
+def plan_output_resume(output_path, entry, total_frames):
+    # Output frame one of a camera's outputs should restart from, total_frames
+    # if it is complete. Image sequences continue after their leading complete
+    # frames; a video only counts as complete once a run recorded it as such.
+    if output_path.endswith(".pngseq") or output_path.endswith(".jpegseq"):
+        return completed_sequence_frames(output_path, total_frames)
+    if output_path in entry.get("completed_outputs", []) and os.path.exists(output_path):
+        return total_frames
+    return 0
+
+
+def plan_job_resume(job, entry, total_frames):
+    # Return (resume_from, proxy_resume_from) for a camera's export and its
+    # proxy, or None if the camera finished with the same parameters and both
+    # outputs are complete. A camera whose proxy pass failed after the
+    # full-resolution export is not done, so it reruns for the proxy alone.
+    if entry is None or entry.get("params_hash") != job["params_hash"]:
+        return 0, 0
+    resume_from = plan_output_resume(job["output_path"], entry, total_frames)
+    proxy_resume_from = total_frames
+    if job["proxy_path"]:
+        proxy_resume_from = plan_output_resume(job["proxy_path"], entry, total_frames)
+    if entry.get("status") == "done" and resume_from >= total_frames and proxy_resume_from >= total_frames:
+        return None
+    return resume_from, proxy_resume_from
+
+
+def record_job_result(manifest, job, result, total_frames):
+    entry = manifest["cameras"][job["name"]]
+    entry["status"] = "done" if result["status"] == "ok" else "failed"
+    entry["error"] = result["error"]
+    entry["alignment"] = result.get("alignment")
+    entry["completed_outputs"] = result.get("completed_outputs", [])
+    if result["status"] == "ok":
+        entry["last_completed_frame"] = total_frames
+    elif job["output_path"].endswith(".pngseq") or job["output_path"].endswith(".jpegseq"):
+        entry["last_completed_frame"] = completed_sequence_frames(job["output_path"], total_frames)
+    else:
+        entry["last_completed_frame"] = 0
+    entry["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def print_job_report(results, skipped):
+    print("\n=== Resync report ===")
+    for result in sorted(results, key=lambda r: r["name"]):
+        line = f"  {result['name']:<40} {result['status']:<7} {result['seconds']:8.1f}s"
+        alignment = result.get("alignment")
+        if alignment:
+            line += (f"  drift max {alignment['max_drift']:.6f} mean {alignment['mean_drift']:.6f}"
+                     f"  dup {alignment['duplicated']} skip {alignment['skipped']}")
+        print(f"{line}  {result['output_path']}")
+    for name, reason in skipped:
+        print(f"  {name:<40} skipped  {reason}")
+    failed = [r for r in results if r["status"] != "ok"]
+    for result in sorted(failed, key=lambda r: r["name"]):
+        print(f"\n[ERROR] Failed to process {result['name']}: {result['error']}")
+        log_tail = result.get("log", "").strip().splitlines()[-10:]
+        for line in log_tail:
+            print(f"    {line}")
+    print(f"\n{len(results) - len(failed)} succeeded, {len(failed)} failed, {len(skipped)} skipped")
+
+
+def join_segmented_takes(input_dir):
+    # Each segmented take arrives as <take>_segNNNN.mjpeg/.pts pairs plus a
+    # <take>.segments.json written when recording stopped. Once every segment
+    # is present, concatenate them into <take>.mjpeg and <take>.pts (JPEG
+    # streams concatenate as-is) so the take is processed like any other.
+    for fname in sorted(os.listdir(input_dir)):
+        if not fname.endswith('.segments.json'):
+            continue
+        take = fname[:-len('.segments.json')]
+        mjpeg_path = os.path.join(input_dir, take + '.mjpeg')
+        pts_path = os.path.join(input_dir, take + '.pts')
+        if os.path.exists(mjpeg_path) and os.path.exists(pts_path):
+            continue
+        with open(os.path.join(input_dir, fname)) as f:
+            segment_count = json.load(f)["segments"]
+        segments = [os.path.join(input_dir, f"{take}_seg{i:04d}") for i in range(1, segment_count + 1)]
+        missing = [os.path.basename(s) + ext for s in segments for ext in ('.mjpeg', '.pts')
+                   if not os.path.exists(s + ext)]
+        if missing:
+            print(f"[!] Not joining {take}: {len(missing)} segment files not transferred yet")
+            continue
+
+        print(f"[→] Joining {segment_count} segments of {take}")
+        with open(mjpeg_path + '.part', 'wb') as out:
+            for segment in segments:
+                with open(segment + '.mjpeg', 'rb') as f:
+                    shutil.copyfileobj(f, out, 1 << 20)
+        with open(pts_path + '.part', 'w') as out:
+            out.write("# timecode format v2\n")
+            for segment in segments:
+                with open(segment + '.pts') as f:
+                    out.writelines(line for line in f if line.strip() and not line.startswith('#'))
+        os.replace(mjpeg_path + '.part', mjpeg_path)
+        os.replace(pts_path + '.part', pts_path)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Batch resync MJPEG videos using PTS to match master timeline")
     parser.add_argument('--input_dir', required=True, help="Directory containing .mjpeg and .pts files")
-    parser.add_argument('--master', required=True, help="Path to master camera PTS file")
+    parser.add_argument('--master', help="Path to master camera PTS file")
+    parser.add_argument('--auto_master', choices=['timeline', 'best'], default=None,
+                        help="Derive the master from the common window of all .pts files in --input_dir: "
+                             "'timeline' builds an even --fps grid, 'best' uses the camera with the fewest drops")
     parser.add_argument('--output_dir', required=True, help="Directory to save synced .mp4 files")
     parser.add_argument('--fps', type=int, default=24, help="Target framerate for output videos")
     parser.add_argument('--debug', action='store_true', help="Enable debug output")
     parser.add_argument('--export_png', action='store_true', help="Export PNG sequence instead of MP4 video")
     parser.add_argument('--export_jpeg', action='store_true', help="Export high quality JPEG sequence instead of MP4/PNG")
+    parser.add_argument('--passthrough', action='store_true', help="With --export_jpeg, copy the original MJPEG frames without decoding or re-encoding")
+    parser.add_argument('--print_alignment', action='store_true', help="Print the alignment of every output frame (a CSV report is always written)")
     parser.add_argument('--start_frame', type=int, default=0, help="Start frame index in master timeline (default: 0)")
     parser.add_argument('--end_frame', type=int, default=None, help="End frame index in master timeline (default: last frame)")
+    parser.add_argument('--workers', type=int, default=1, help="Number of cameras to resync in parallel processes (default: 1)")
+    parser.add_argument('--writer_threads', type=int, default=None, help="Threads encoding PNG/JPEG sequence frames per camera (default: CPU count divided by --workers)")
+    parser.add_argument('--png_compression', type=int, choices=range(10), default=None, help="PNG zlib compression level 0-9 (default: OpenCV default)")
+    parser.add_argument('--jpeg_quality', type=int, default=100, help="JPEG quality 0-100 for re-encoded JPEG sequences (default: 100)")
+    parser.add_argument('--encoder', choices=['opencv', 'ffmpeg'], default='opencv', help="MP4 encoder backend: OpenCV mp4v or an ffmpeg subprocess (default: opencv)")
+    parser.add_argument('--codec', choices=sorted(FFMPEG_CODEC_ARGS), default='libx264', help="Codec for --encoder ffmpeg; mjpeg copies the camera frames without re-encoding (default: libx264)")
+    parser.add_argument('--preset', default='medium', help="x264/x265 preset for --encoder ffmpeg (default: medium)")
+    parser.add_argument('--encoder_threads', type=int, default=0, help="ffmpeg encoder threads, 0 lets ffmpeg decide (default: 0)")
+    parser.add_argument('--proxy_scale', type=int, choices=[2, 4, 8], default=None, help="Also write a 1/2, 1/4 or 1/8 resolution proxy using scaled JPEG decoding")
+    parser.add_argument('--proxy_only', action='store_true', help="With --proxy_scale, write only the proxy and skip the full-resolution export")
+    parser.add_argument('--mosaic', default=None, help="Write a single tiled preview video of all cameras to this path instead of per-camera exports")
+    parser.add_argument('--mosaic_scale', type=int, choices=[2, 4, 8], default=8, help="Decode scale of the mosaic tiles (default: 8)")
+    parser.add_argument('--mosaic_columns', type=int, default=None, help="Number of mosaic columns (default: square grid)")
+    parser.add_argument('--no_dedupe', action='store_true', help="Encode every sequence frame, instead of linking frames that repeat the previous source frame")
+    parser.add_argument('--force', action='store_true', help="Rebuild every camera, ignoring the manifest of previous runs in --output_dir")
+    parser.add_argument('--memory_budget_gb', type=float, default=None, help="Memory budget for parallel jobs in GB (default: half of physical RAM)")
     args = parser.parse_args()
 
     if not os.path.exists(args.input_dir):
         raise FileNotFoundError(f"Missing input directory: {args.input_dir}")
-    if not os.path.exists(args.master):
+    if args.master is None and args.auto_master is None:
+        parser.error("one of --master or --auto_master is required")
+    if args.master is not None and args.auto_master is not None:
+        parser.error("--master and --auto_master are mutually exclusive")
+    if args.master is not None and not os.path.exists(args.master):
         raise FileNotFoundError(f"Missing master PTS file: {args.master}")
+    if args.passthrough and not args.export_jpeg:
+        parser.error("--passthrough requires --export_jpeg")
+    if args.proxy_only and args.proxy_scale is None:
+        parser.error("--proxy_only requires --proxy_scale")
+    if args.proxy_only and args.passthrough:
+        parser.error("--proxy_only cannot be combined with --passthrough")
     if not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir)
 
-    master_pts = np.loadtxt(args.master)
-    # Apply frame range
-    start = args.start_frame
-    end = args.end_frame if args.end_frame is not None else len(master_pts)
-    master_pts = master_pts[start:end]
-
     # Find all .mjpeg files in input_dir, process in alphabetical order
-    mjpeg_files = sorted([f for f in os.listdir(args.input_dir) if f.lower().endswith('.mjpeg')])
+    join_segmented_takes(args.input_dir)
+    mjpeg_files = sorted([f for f in os.listdir(args.input_dir)
+                          if f.lower().endswith('.mjpeg') and not SEGMENT_FILE_PATTERN.search(f)])
+    jobs = []
+    skipped = []
     for idx, fname in enumerate(mjpeg_files):
         mjpeg_path = os.path.join(args.input_dir, fname)
         pts_path = os.path.join(args.input_dir, os.path.splitext(fname)[0] + '.pts')
@@ -138,26 +1338,123 @@ def main():
         elif args.export_png:
             output_path = os.path.join(args.output_dir, cam_dir, ".pngseq")
         else:
-            output_path = os.path.join(args.output_dir, os.path.splitext(fname)[0] + '.mp4')
+            ext = '.mov' if args.encoder == 'ffmpeg' and args.codec == 'prores' else '.mp4'
+            output_path = os.path.join(args.output_dir, os.path.splitext(fname)[0] + ext)
+
+        proxy_path = None
+        if args.proxy_only:
+            output_path = proxy_output_path(output_path, args.proxy_scale)
+        elif args.proxy_scale is not None:
+            proxy_path = proxy_output_path(output_path, args.proxy_scale)
 
         if not os.path.exists(pts_path):
             print(f"[!] Skipping {fname}: missing corresponding .pts file.")
+            skipped.append((fname, "missing corresponding .pts file"))
             continue
+        jobs.append({"name": fname, "mjpeg_path": mjpeg_path, "pts_path": pts_path, "output_path": output_path,
+                     "proxy_path": proxy_path})
 
-        print(f"[→] Syncing {fname} ...")
-        try:
-            resync_video_with_pts(
-                mjpeg_path=mjpeg_path,
-                pts_path=pts_path,
-                output_path=output_path,
-                master_pts=master_pts,
-                target_fps=args.fps,
-                debug=args.debug
-            )
-            print(f"[✓] Finished syncing {fname}")
-        except Exception as e:
-            print(f"[ERROR] Failed to process {fname}: {e}")
+    if args.auto_master is not None:
+        camera_pts = {job["name"]: load_pts(job["pts_path"], args.debug) for job in jobs}
+        camera_pts = {name: pts for name, pts in camera_pts.items() if len(pts) > 0}
+        if not camera_pts:
+            raise RuntimeError(f"No usable .pts files in {args.input_dir}")
+        master_pts = auto_master_timeline(camera_pts, args.auto_master, args.fps, args.debug)
+    else:
+        master_pts = load_pts(args.master, args.debug)
+    # Apply frame range
+    start = args.start_frame
+    end = args.end_frame if args.end_frame is not None else len(master_pts)
+    master_pts = master_pts[start:end]
+
+    writer_threads = args.writer_threads or max(1, (os.cpu_count() or 1) // max(1, args.workers))
+    options = {
+        "fps": args.fps,
+        "debug": args.debug,
+        "passthrough": args.passthrough,
+        "sequence": args.export_png or args.export_jpeg,
+        "png_compression": args.png_compression,
+        "jpeg_quality": args.jpeg_quality,
+        "writer_threads": writer_threads,
+        "print_alignment": args.print_alignment,
+        "encoder": args.encoder,
+        "codec": args.codec,
+        "preset": args.preset,
+        "encoder_threads": args.encoder_threads,
+        "proxy_scale": args.proxy_scale or 1,
+        "proxy_only": args.proxy_only,
+        "dedupe": not args.no_dedupe,
+    }
 
+    if args.mosaic is not None:
+        export_mosaic(jobs, master_pts, args.mosaic, args.fps, args.mosaic_scale, args.mosaic_columns, args.debug,
+                      args.encoder, args.codec, args.preset, args.encoder_threads)
+        return
+
+    # Skip cameras the manifest says are complete for these exact inputs and
+    # parameters, and continue partially written image sequences.
+    manifest = load_manifest(args.output_dir)
+    master_hash = hashlib.sha1(np.ascontiguousarray(master_pts, dtype=np.float64).tobytes()).hexdigest()
+    total_frames = len(master_pts)
+    pending_jobs = []
+    for job in jobs:
+        params = job_parameters(job, master_hash, options, start, end)
+        job["params_hash"] = hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        entry = None if args.force else manifest["cameras"].get(job["name"])
+        plan = plan_job_resume(job, entry, total_frames)
+        if plan is None:
+            print(f"[✓] {job['name']} is up to date, skipping")
+            skipped.append((job["name"], "up to date"))
+            continue
+        if entry is None or entry.get("params_hash") != job["params_hash"]:
+            # Rebuilding from scratch: drop frames from an earlier run first, so
+            # an interrupted rebuild never resumes on top of them.
+            for path in (job["output_path"], job["proxy_path"]):
+                if path and clear_sequence_frames(path):
+                    print(f"[→] Cleared previous frames of {path}")
+        else:
+            for path in (job["output_path"], job["proxy_path"]):
+                if path and clear_sequence_frames(path, parts_only=True):
+                    print(f"[→] Removed partial frames of {path}")
+        job["resume_from"], job["proxy_resume_from"] = plan
+        # A finished export is not rerun for its proxy, so keep its alignment summary
+        job["alignment"] = entry.get("alignment") if entry is not None and plan[0] >= total_frames else None
+        manifest["cameras"][job["name"]] = {
+            "status": "running",
+            "params": params,
+            "params_hash": job["params_hash"],
+            "output_path": job["output_path"],
+            "proxy_path": job["proxy_path"],
+            "total_frames": total_frames,
+            "last_completed_frame": job["resume_from"],
+        }
+        pending_jobs.append(job)
+    jobs = pending_jobs
+    save_manifest(args.output_dir, manifest)
+
+    def on_result(job, result):
+        record_job_result(manifest, job, result, total_frames)
+        save_manifest(args.output_dir, manifest)
+
+    if args.workers > 1:
+        memory_budget = default_memory_budget() if args.memory_budget_gb is None else int(args.memory_budget_gb * 1024 ** 3)
+        print(f"[→] Resyncing {len(jobs)} cameras with {args.workers} workers, "
+              f"memory budget {memory_budget / 1024 ** 3:.1f} GB")
+        results = run_jobs_parallel(jobs, master_pts, options, args.workers, memory_budget, on_result)
+    else:
+        results = []
+        for job in jobs:
+            print(f"[→] Syncing {job['name']} ...")
+            result = run_camera_job(job, master_pts, options)
+            if result["status"] == "ok":
+                print(f"[✓] Finished syncing {job['name']}")
+            else:
+                print(f"[ERROR] Failed to process {job['name']}: {result['error']}")
+            on_result(job, result)
+            results.append(result)
+    print_job_report(results, skipped)
+    if any(result["status"] != "ok" for result in results):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()